@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 Tim Rightnour <thegarbledone@gmail.com>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+class ModuleDocFragment(object):
+
+    # sysparm_ options of the ServiceNow modules and lookup, see module_utils/snow_common.py
+    DOCUMENTATION = '''
+options:
+    exclude_reference_link:
+        description:
+            - Leave the link objects out of reference fields, which then only hold their value.
+        required: false
+        default: false
+        type: bool
+        version_added: "2.5"
+    display_value:
+        description:
+            - C(false) returns the values stored in the database, C(true) the display
+              values, C(all) a dict holding both for every field.
+        required: false
+        default: "false"
+        choices: [ "true", "false", "all" ]
+        version_added: "2.5"
+    no_count:
+        description:
+            - Do not have ServiceNow count the matching records for every request.
+        required: false
+        default: false
+        type: bool
+        version_added: "2.5"
+'''
@@ -12,41 +12,66 @@ DOCUMENTATION = '''
 ---
 module: snow_get_record
 
-short_description: Get a single record from ServiceNow
+short_description: Get records from ServiceNow
 
 version_added: "2.4"
 
 description:
     - Gets a single record of a specified type from ServiceNow denoted
       by number (record number)
+    - Gets many records at once with C(numbers), using as few C(IN) queries
+      as fit in C(max_url_length)
 
 options:
     instance:
-	description:
+        description:
             - The service now instance name
         required: true
     username:
-	description:
+        description:
             - User to connect to ServiceNow as
         required: true
     password:
-	description:
+        description:
             - Password for username
         required: true
     table:
-	description:
+        description:
             - Table to query for record
         required: false
         default: incident
     number:
-	description:
+        description:
             - Record number to find, ex: INC01234
-        required: true
+            - One of C(number) or C(numbers) is required.
+        required: false
+    numbers:
+        description:
+            - List of record numbers to find. The records are returned in C(records),
+              keyed by number, and the numbers that match no record in C(not_found).
+            - Numbers are looked up with C(lookup_field IN) queries, as many per query
+              as fit in C(max_url_length). Numbers holding a C(,) get a query
+              of their own.
+        required: false
+        version_added: "2.5"
+    lookup_field:
+        description:
+            - Field of the record that C(number) and C(numbers) are matched against
+        required: false
+        default: number
+        version_added: "2.5"
+    max_url_length:
+        description:
+            - Maximum length of the URL of a single query with C(numbers).
+        required: false
+        default: 2048
+        version_added: "2.5"
     return_fields:
-	description:
-	    - Fields of the record to return in the json
+        description:
+            - Fields of the record to return in the json
         required: false
         default: all fields
+extends_documentation_fragment: snow_sysparm
 
 requirements:
     - python pysnow (pysnow)
@@ -64,15 +89,49 @@ EXAMPLES = '''
     number: INC0000055
     table: incident
 
+- name: Get the short description of a list of incidents
+  snow_get_record:
+    username: ansible_test
+    password: my_password
+    instance: dev99999
+    numbers: "{{ incident_numbers }}"
+    return_fields:
+      - short_description
+  register: incidents
+
+- name: Get user records by sys_id
+  snow_get_record:
+    username: ansible_test
+    password: my_password
+    instance: dev99999
+    table: sys_user
+    lookup_field: sys_id
+    numbers:
+      - 62826bf03710200044e0bfc8bcbe5df1
+      - 5137153cc611227c000bbd1bd8cd2005
 '''
 
 RETURN = '''
-    record:
-	record: The full contents of the ServiceNow record
-        type: dict
+record:
+    description: The full contents of the ServiceNow record
+    type: dict
+    returned: when number is given
+records:
+    description: The records found, keyed by the number they matched
+    type: dict
+    returned: when numbers is given
+    sample: {"INC0000055": {"short_description": "Printer on fire"}}
+not_found:
+    description: The numbers that matched no record
+    type: list
+    returned: when numbers is given
+    sample: ["INC0000099"]
 '''
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils._text import to_native
+from ansible.module_utils.snow_common import (PAGING_PLACEHOLDER, escape, field_value, in_queries, record_as,
+                                              request_params, sysparm_argument_spec)
 
 # Pull in pysnow
 HAS_PYSNOW=False
@@ -83,6 +142,44 @@ try:
 except ImportError:
     pass
 
+def get_many(conn, numbers, params):
+    '''
+    Find the records of numbers, which must be unique, with as few IN
+    queries as fit in max_url_length. Return a dict of number -> list of records.
+    conn must read with display_value=all when display_value is true, so
+    records can be told apart by the raw value of lookup_field.
+    '''
+    lookup_field = params['lookup_field']
+    return_fields = params['return_fields']
+    # the lookup field is needed to tell which number a record belongs to
+    fields = list(return_fields or [])
+    if fields and lookup_field not in fields:
+        fields.append(lookup_field)
+
+    sysparms = dict(conn.request_params, **PAGING_PLACEHOLDER)
+    if fields:
+        sysparms['sysparm_fields'] = ','.join(fields)
+    url = 'https://%s.service-now.com/api/now/table/%s' % (params['instance'], params['table'])
+    found = dict()
+    for chunk, query in in_queries(lookup_field, numbers, url, sysparms, params['max_url_length']):
+        try:
+            record = conn.query(table=params['table'], query=query)
+            for res in record.get_multiple(fields=fields):
+                key = field_value(res.get(lookup_field))
+                if return_fields and lookup_field not in return_fields:
+                    res.pop(lookup_field, None)
+                if params['display_value'] == 'true':
+                    res = record_as(res, 'true')
+                found.setdefault(key, []).append(res)
+        except pysnow.exceptions.NoResults:
+            pass
+
+    # ServiceNow compares strings case insensitively
+    folded = dict()
+    for key, records in found.items():
+        folded.setdefault(key.lower(), []).extend(records)
+    return dict((number, found.get(number) or folded.get(number.lower(), [])) for number in numbers)
+
 def run_module():
 
     # define the available arguments/parameters that a user can pass to
@@ -92,13 +189,19 @@ def run_module():
         username=dict(default=None, type='str', required=True, no_log=True),
         password=dict(default=None, type='str', required=True, no_log=True),
         table=dict(type='str', required=False, default='incident'),
-        number=dict(default=None, type='str', required=True),
-        return_fields=dict(default=None, type='list', required=False)
+        number=dict(default=None, type='str', required=False),
+        numbers=dict(default=None, type='list', required=False),
+        lookup_field=dict(default='number', type='str', required=False),
+        max_url_length=dict(default=2048, type='int', required=False),
+        return_fields=dict(default=None, type='list', required=False),
     )
+    module_args.update(sysparm_argument_spec())
 
     module = AnsibleModule(
         argument_spec=module_args,
-        supports_check_mode=True
+        supports_check_mode=True,
+        required_one_of=[['number', 'numbers']],
+        mutually_exclusive=[['number', 'numbers']]
     )
     # check for pysnow
     if not HAS_PYSNOW:
@@ -109,26 +212,56 @@ def run_module():
         instance=module.params['instance'],
         table=module.params['table'],
         number=module.params['number'],
+        lookup_field=module.params['lookup_field'],
     )
 
     # do the lookup
     try:
         conn = pysnow.Client(instance=module.params['instance'],
                              user=module.params['username'],
-                             password=module.params['password'])
-    except:
-        module.fail_json(msg='Could not connect to ServiceNow', **result)
+                             password=module.params['password'],
+                             request_params=request_params(module.params))
+    except Exception as detail:
+        module.fail_json(msg='Could not connect to ServiceNow: {0}'.format(to_native(detail)), **result)
+
+    if module.params['numbers'] is not None:
+        numbers = []
+        seen = set()
+        for number in module.params['numbers']:
+            number = to_native(number)
+            if number not in seen:
+                seen.add(number)
+                numbers.append(number)
+        try:
+            many_conn = conn
+            if module.params['display_value'] == 'true':
+                # display values cannot be matched back to numbers, read both and keep the display ones
+                many_conn = pysnow.Client(instance=module.params['instance'], session=conn.session,
+                                          request_params=dict(conn.request_params, sysparm_display_value='all'))
+            found = get_many(many_conn, numbers, module.params)
+        except Exception as detail:
+            module.fail_json(msg='Failed to query records: {0}'.format(to_native(detail)), **result)
+        multiple = [number for number in numbers if len(found[number]) > 1]
+        if multiple:
+            module.fail_json(msg='Multiple record match: {0}'.format(', '.join(multiple)), **result)
+        result['records'] = dict((number, records[0]) for number, records in found.items() if records)
+        result['not_found'] = [number for number in numbers if not found[number]]
+        module.exit_json(**result)
 
     try:
         record = conn.query(table=module.params['table'],
-                            query={ 'number' : module.params['number'] })
+                            query='%s=%s' % (module.params['lookup_field'], escape(module.params['number'])))
         if module.params['return_fields'] is None:
             res = record.get_one()
         else:
             res = record.get_one(module.params['return_fields'])
         result['record'] = res
-    except:
+    except pysnow.exceptions.NoResults:
         module.fail_json(msg='Failed to find record', **result)
+    except pysnow.exceptions.MultipleResults:
+        module.fail_json(msg='Multiple record match', **result)
+    except Exception as detail:
+        module.fail_json(msg='Failed to find record: {0}'.format(to_native(detail)), **result)
 
     module.exit_json(**result)
 
@@ -55,6 +55,9 @@ options:
     number:
         description:
             - Record number to update. Required for C(state:absent)
+            - Updates first read the fields given in C(data), and only write the
+              ones whose value differs, comparing both the value and the display value.
+              Nothing is written, and C(changed) is false, when no field differs.
         required: false
     lookup_field:
         description:
@@ -63,8 +66,57 @@ options:
         default: number
     attachment:
         description:
-            - Attach a file to the record
+            - Attach a file, or a list of files, to the record
+            - Files are streamed from disk to C(/api/now/attachment/file) with chunked
+              transfer encoding, C(concurrency) at a time, so they are never read
+              into memory whole.
+            - A file is skipped when the record already has an attachment with the
+              same file name and the same SHA-256 hash.
         required: false
+    return_fields:
+        description:
+            - Fields of the record to return, also for inserts and updates,
+              which otherwise echo the full record.
+        required: false
+        default: all fields
+        version_added: "2.5"
+    records:
+        description:
+            - List of record operations to apply in bulk, instead of C(number) and C(data).
+            - Each item is a dict with C(data), C(number), and optionally C(state),
+              C(table) and C(lookup_field), which default to the module options.
+              Items with C(state=present) and no C(number) are created, with a
+              C(number) they are updated, and C(state=absent) deletes them.
+            - The records to update or delete are found with as few C(IN) queries of at
+              most C(chunk_size) numbers as fit in 2048 character URLs, numbers holding a
+              C(,) with a query of their own. The operations are then sent C(chunk_size)
+              at a time through the Batch API (C(/api/now/v1/batch)).
+        required: false
+        version_added: "2.5"
+    chunk_size:
+        description:
+            - Number of operations sent per Batch API request with C(records).
+        required: false
+        default: 100
+        version_added: "2.5"
+    concurrency:
+        description:
+            - Number of Table API requests sent at the same time with C(records),
+              when the Batch API is disabled or not available on the instance,
+              and for operations the Batch API did not service.
+            - Also the number of files of C(attachment) uploaded at the same time.
+        required: false
+        default: 4
+        version_added: "2.5"
+    use_batch_api:
+        description:
+            - Send C(records) through the Batch API. When C(no), or when the instance
+              does not offer it, every operation is a Table API request.
+        required: false
+        default: true
+        type: bool
+        version_added: "2.5"
+extends_documentation_fragment: snow_sysparm
 
 requirements:
     - python pysnow (pysnow)
@@ -132,6 +184,47 @@ EXAMPLES = '''
     number: INC0000055
     attachment: README.md
   tags: attach
+
+- name: Attach log bundles, skipping the ones already attached
+  snow_record:
+    username: ansible_test
+    password: my_password
+    instance: dev99999
+    state: present
+    number: INC0000055
+    attachment:
+      - /var/tmp/sosreport-web01.tar.xz
+      - /var/tmp/sosreport-web02.tar.xz
+
+- name: Build one task_ci record per CI
+  set_fact:
+    ci_records: "{{ ci_records | default([]) + [{'data': {'task': mytask.record.sys_id, 'ci_item': item.sys_id}}] }}"
+  with_items: "{{ cis.record }}"
+
+- name: Attach the list of CIs to a task in one go
+  snow_record:
+    username: ansible_test
+    password: my_password
+    instance: dev99999
+    table: task_ci
+    state: present
+    records: "{{ ci_records }}"
+
+- name: Close two incidents and delete a third
+  snow_record:
+    username: ansible_test
+    password: my_password
+    instance: dev99999
+    state: present
+    records:
+      - number: INC0000055
+        data:
+          state: 7
+      - number: INC0000054
+        data:
+          state: 7
+      - number: INC0000053
+        state: absent
 '''
 
 RETURN = '''
@@ -142,23 +235,461 @@ record:
 attached_file:
    description: Details of the file that was attached via C(attachment)
    type: dict
-   returned: when supported
+   returned: when a single file was attached
+attached_files:
+   description: Outcome of every file of C(attachment), in order
+   type: list
+   returned: when attachment is given
+   sample: [{"path": "/var/tmp/sosreport-web01.tar.xz", "file_name": "sosreport-web01.tar.xz",
+             "hash": "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08",
+             "changed": false, "failed": false, "msg": "Already attached"}]
+diff:
+   description: Previous and new values of the fields an update changed
+   type: dict
+   returned: when an update changed the record
+   sample: {"before": {"state": "2"}, "after": {"state": 7}}
+records:
+   description: Outcome of every operation given in C(records), in order
+   type: list
+   returned: when records is given
+   sample: [{"index": 0, "operation": "create", "table": "task_ci", "status_code": 201,
+             "changed": true, "failed": false, "record": {"sys_id": "2d8723d9db6c4300c791fe1ebf961941"}}]
 '''
 
+import base64
+import hashlib
+import json
+import mimetypes
 import os
+import threading
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils._text import to_bytes, to_native
+from ansible.module_utils.six.moves import queue
+from ansible.module_utils.six.moves.urllib.parse import urlencode
+from ansible.module_utils._text import to_bytes, to_native, to_text
+from ansible.module_utils.snow_common import (PAGING_PLACEHOLDER, SessionPool, field_value, in_queries, record_as,
+                                              request_params, sysparm_argument_spec)
 
 # Pull in pysnow
 HAS_PYSNOW = False
 try:
     import pysnow
+    import requests
     HAS_PYSNOW = True
 
 except ImportError:
     pass
 
+# longest URL the lookups of records by number are packed into
+MAX_URL_LENGTH = 2048
+
+
+def return_projection(params):
+    ''' return_fields as a sysparm_fields list, always holding sys_id, or None for all fields '''
+    if not params['return_fields']:
+        return None
+    fields = list(params['return_fields'])
+    if 'sys_id' not in fields:
+        fields.append('sys_id')
+    return fields
+
+
+def table_write(session, method, url, payload, sysparms):
+    ''' Send a Table API write, return the record it echoes, raise with the ServiceNow error on failure '''
+    response = session.request(method, url, params=sysparms, data=json.dumps(payload))
+    if not 200 <= response.status_code < 300:
+        try:
+            error = response.json().get('error', {})
+            detail = '{0}, details: {1}'.format(error.get('message', response.reason), error.get('detail', ''))
+        except (ValueError, AttributeError):
+            detail = response.reason or 'HTTP status {0}'.format(response.status_code)
+        raise requests.HTTPError(detail, response=response)
+    return response.json().get('result')
+
+
+def rest_session(params):
+    ''' requests session for direct REST calls '''
+    session = requests.Session()
+    session.auth = (params['username'], params['password'])
+    session.headers.update({'Accept': 'application/json', 'Content-Type': 'application/json'})
+    return session
+
+
+def normalize(value):
+    ''' Text form of a value as ServiceNow stores it: booleans lowercase, numbers and references as text '''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if value is None:
+        return ''
+    return to_text(value).strip()
+
+
+def field_values(value):
+    ''' The normalized forms a returned field matches: its value and its display value '''
+    if isinstance(value, dict):
+        # reference links and display_value=all come back as a dict
+        forms = [value.get('value'), value.get('display_value')]
+    else:
+        forms = [value]
+    return set(normalize(form) for form in forms if form is not None)
+
+
+def diff_record(current, data):
+    ''' Return the items of data whose value differs from the current record '''
+    changes = dict()
+    for key, value in data.items():
+        if key not in current or normalize(value) not in field_values(current[key]):
+            changes[key] = value
+    return changes
+
+
+class BulkRecords(object):
+    '''
+    Creates, updates and deletes many records, chunk_size at a time,
+    through the Batch API, or through concurrent Table API requests, each
+    worker on a session of its own, where the Batch API is not available.
+    '''
+
+    def __init__(self, module, sysparms):
+        self.module = module
+        self.params = module.params
+        self.base_url = 'https://%s.service-now.com' % self.params['instance']
+        self.sysparms = sysparms
+        self.use_batch = self.params['use_batch_api']
+        self.sessions = SessionPool(lambda: rest_session(self.params))
+
+    def parse_items(self):
+        ''' Validate the records option, return one result dict per item '''
+        items = []
+        for index, item in enumerate(self.params['records']):
+            if not isinstance(item, dict):
+                self.module.fail_json(msg='records item {0} is not a dict'.format(index))
+            unknown = set(item) - set(['state', 'number', 'data', 'table', 'lookup_field'])
+            if unknown:
+                self.module.fail_json(msg='records item {0} has unsupported keys: {1}'.format(index, ', '.join(unknown)))
+            state = item.get('state', self.params['state'])
+            if state not in ('present', 'absent'):
+                self.module.fail_json(msg='records item {0} has an invalid state: {1}'.format(index, state))
+            number = item.get('number')
+            if number is not None:
+                number = to_native(number)
+            if state == 'absent' and number is None:
+                self.module.fail_json(msg='records item {0} needs a number to be deleted'.format(index))
+            if state == 'present' and number is None and not item.get('data'):
+                self.module.fail_json(msg='records item {0} needs data to be created'.format(index))
+            operation = 'delete' if state == 'absent' else ('update' if number is not None else 'create')
+            items.append(dict(index=index, operation=operation, table=item.get('table', self.params['table']),
+                              lookup_field=item.get('lookup_field', self.params['lookup_field']),
+                              number=number, data=item.get('data'), changed=False, failed=False))
+        return items
+
+    def resolve(self, items):
+        ''' Find the sys_id of every update and delete, with one IN query per table and lookup field chunk '''
+        groups = dict()
+        for item in items:
+            if item['operation'] == 'create':
+                continue
+            if item['lookup_field'] == 'sys_id' and item['operation'] == 'delete':
+                item['sys_id'] = item['number']
+                continue
+            groups.setdefault((item['table'], item['lookup_field']), []).append(item)
+
+        for (table, lookup_field), group in groups.items():
+            numbers = sorted(set(item['number'] for item in group))
+            # read the current values of the fields to update, to only write what changed
+            fields = set(['sys_id', lookup_field])
+            for item in group:
+                if item['operation'] == 'update':
+                    fields.update(item['data'] or {})
+            url = self.base_url + '/api/now/table/' + table
+            sysparms = dict(sysparm_fields=','.join(sorted(fields)), sysparm_exclude_reference_link='true',
+                            sysparm_display_value='all', sysparm_no_count='true')
+            found = dict()
+            for start in range(0, len(numbers), self.params['chunk_size']):
+                queries = in_queries(lookup_field, numbers[start:start + self.params['chunk_size']], url,
+                                     dict(sysparms, **PAGING_PLACEHOLDER), MAX_URL_LENGTH, suffix='^ORDERBYsys_id')
+                for chunk, query in queries:
+                    # a number can match several records, follow the offsets until a short page
+                    limit = len(chunk) + 1
+                    offset = 0
+                    while True:
+                        with self.sessions.session() as session:
+                            response = session.get(url, params=dict(sysparms, sysparm_query=query,
+                                                                    sysparm_limit=limit, sysparm_offset=offset))
+                        if response.status_code == 404:
+                            break
+                        response.raise_for_status()
+                        page = response.json().get('result', [])
+                        for record in page:
+                            found.setdefault(field_value(record[lookup_field]), []).append(record)
+                        if len(page) < limit:
+                            break
+                        offset += limit
+            # ServiceNow compares strings case insensitively
+            folded = dict()
+            for key, records in found.items():
+                folded.setdefault(key.lower(), []).extend(records)
+            for item in group:
+                records = found.get(item['number']) or folded.get(item['number'].lower(), [])
+                if len(records) > 1:
+                    item.update(failed=True, msg='Multiple record match')
+                elif records:
+                    item['sys_id'] = records[0]['sys_id']['value']
+                    if item['operation'] == 'update':
+                        item['current'] = records[0]
+                elif item['operation'] == 'delete':
+                    item['msg'] = 'Record does not exist'
+                else:
+                    item.update(failed=True, msg='Record does not exist')
+
+    def table_request(self, item):
+        ''' Return (method, path with query string, body or None) for an item '''
+        path = '/api/now/table/' + item['table']
+        if item['operation'] != 'create':
+            path += '/' + item['sys_id']
+        if self.sysparms and item['operation'] != 'delete':
+            path += '?' + urlencode(self.sysparms)
+        if item['operation'] == 'create':
+            return 'POST', path, json.dumps(item['data'])
+        if item['operation'] == 'update':
+            return 'PATCH', path, json.dumps(item['data'] or {})
+        return 'DELETE', path, None
+
+    def record_result(self, item, status, reason, body):
+        item['status_code'] = status
+        if 200 <= status < 300:
+            item['changed'] = True
+            if body:
+                try:
+                    item['record'] = json.loads(body).get('result')
+                except ValueError:
+                    pass
+            return
+        item['failed'] = True
+        try:
+            error = json.loads(body).get('error', {})
+            item['msg'] = '{0}: {1}'.format(error.get('message', reason), error.get('detail', ''))
+        except (ValueError, TypeError, AttributeError):
+            item['msg'] = reason or 'HTTP status {0}'.format(status)
+
+    def send_batch(self, chunk):
+        '''
+        Send a chunk through the Batch API. Return the items the instance did
+        not service, or None when the Batch API is not available.
+        '''
+        rest_requests = []
+        for item in chunk:
+            method, path, body = self.table_request(item)
+            rest_request = dict(id=str(item['index']), method=method, url=path, headers=[
+                dict(name='Content-Type', value='application/json'),
+                dict(name='Accept', value='application/json'),
+            ])
+            if body is not None:
+                rest_request['body'] = to_native(base64.b64encode(to_bytes(body)))
+            rest_requests.append(rest_request)
+        with self.sessions.session() as session:
+            response = session.post(self.base_url + '/api/now/v1/batch', data=json.dumps(dict(
+                batch_request_id=str(chunk[0]['index']), rest_requests=rest_requests)))
+        if response.status_code in (400, 403, 404, 405):
+            return None
+        response.raise_for_status()
+
+        by_id = dict((str(item['index']), item) for item in chunk)
+        for served in response.json().get('serviced_requests', []):
+            item = by_id.pop(served['id'], None)
+            if item is None:
+                continue
+            body = served.get('body')
+            if body:
+                body = to_native(base64.b64decode(body))
+            self.record_result(item, served['status_code'], served.get('status_text'), body)
+        return list(by_id.values())
+
+    def send_direct(self, chunk):
+        ''' Send a chunk as individual Table API requests from concurrency worker threads '''
+        work = queue.Queue()
+        for item in chunk:
+            work.put(item)
+
+        def worker():
+            with self.sessions.session() as session:
+                while True:
+                    try:
+                        item = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    method, path, body = self.table_request(item)
+                    try:
+                        response = session.request(method, self.base_url + path, data=body)
+                        self.record_result(item, response.status_code, response.reason, response.text)
+                    except Exception as detail:
+                        item.update(failed=True, msg=to_native(detail))
+
+        threads = [threading.Thread(target=worker) for i in range(min(self.params['concurrency'], len(chunk)))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+
+    def run(self):
+        items = self.parse_items()
+        try:
+            self.resolve(items)
+        except Exception as detail:
+            self.module.fail_json(msg='Failed to look up records: {0}'.format(to_native(detail)))
+
+        for item in items:
+            current = item.pop('current', None)
+            if current is not None:
+                item['data'] = diff_record(current, item['data'] or {})
+                if not item['data']:
+                    item['msg'] = 'Record is unchanged'
+                    del item['sys_id']
+        pending = [item for item in items if not item['failed'] and
+                   (item['operation'] == 'create' or 'sys_id' in item)]
+        if self.module.check_mode:
+            for item in pending:
+                item['changed'] = True
+            return items
+
+        for start in range(0, len(pending), self.params['chunk_size']):
+            chunk = pending[start:start + self.params['chunk_size']]
+            if self.use_batch:
+                try:
+                    unserviced = self.send_batch(chunk)
+                except Exception as detail:
+                    self.module.fail_json(msg='Batch request failed: {0}'.format(to_native(detail)), records=items)
+                if unserviced is None:
+                    # not available on this instance, stop trying
+                    self.use_batch = False
+                else:
+                    chunk = unserviced
+            if chunk:
+                self.send_direct(chunk)
+        return items
+
+
+class Attachments(object):
+    '''
+    Streams files from disk to the Attachment API, concurrency at a time,
+    skipping the ones the record already holds with the same name and hash.
+    '''
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, module, paths):
+        self.module = module
+        self.params = module.params
+        self.base_url = 'https://%s.service-now.com' % self.params['instance']
+        self.sessions = SessionPool(lambda: rest_session(self.params))
+        self.items = [dict(path=path, file_name=os.path.basename(path), changed=False, failed=False)
+                      for path in paths]
+
+    def file_hash(self, path):
+        digest = hashlib.sha256()
+        with open(to_bytes(path, errors='surrogate_or_strict'), 'rb') as f:
+            for block in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def existing(self, table, sys_id):
+        ''' Return the set of (file_name, hash) of the attachments of a record '''
+        with self.sessions.session() as session:
+            response = session.get(self.base_url + '/api/now/attachment', params=dict(
+                sysparm_query='table_name={0}^table_sys_id={1}'.format(table, sys_id),
+                sysparm_fields='file_name,hash'))
+        response.raise_for_status()
+        return set((to_native(a.get('file_name')), to_native(a.get('hash')))
+                   for a in response.json().get('result', []))
+
+    def plan(self, table, sys_id):
+        ''' Hash the files and return the ones that are not attached yet '''
+        attached = self.existing(table, sys_id)
+        pending = []
+        for item in self.items:
+            item['hash'] = self.file_hash(item['path'])
+            if (item['file_name'], item['hash']) in attached:
+                item['msg'] = 'Already attached'
+            else:
+                pending.append(item)
+        return pending
+
+    def stream(self, path):
+        ''' Generator over the file, which requests sends with chunked transfer encoding '''
+        with open(to_bytes(path, errors='surrogate_or_strict'), 'rb') as f:
+            for block in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                yield block
+
+    def upload(self, session, table, sys_id, item):
+        content_type = mimetypes.guess_type(item['file_name'])[0] or 'application/octet-stream'
+        try:
+            response = session.post(self.base_url + '/api/now/attachment/file', params=dict(
+                table_name=table, table_sys_id=sys_id, file_name=item['file_name']),
+                data=self.stream(item['path']), headers={'Content-Type': content_type})
+            item['status_code'] = response.status_code
+            if 200 <= response.status_code < 300:
+                item['changed'] = True
+                item['attachment'] = response.json().get('result')
+            else:
+                item.update(failed=True, msg='{0}: {1}'.format(response.reason, response.text))
+        except Exception as detail:
+            item.update(failed=True, msg=to_native(detail))
+
+    def run(self, table, sys_id):
+        try:
+            pending = self.plan(table, sys_id)
+        except Exception as detail:
+            self.module.fail_json(msg='Failed to list attachments: {0}'.format(to_native(detail)),
+                                  attached_files=self.items)
+        if self.module.check_mode:
+            for item in pending:
+                item['changed'] = True
+            return self.items
+
+        work = queue.Queue()
+        for item in pending:
+            work.put(item)
+
+        def worker():
+            with self.sessions.session() as session:
+                while True:
+                    try:
+                        item = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    self.upload(session, table, sys_id, item)
+
+        threads = [threading.Thread(target=worker) for i in range(min(self.params['concurrency'], len(pending)))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        return self.items
+
+
+def record_sys_id(record, res):
+    ''' sys_id of the record a query matches, from a fetched result when it holds it '''
+    sys_id = res.get('sys_id') if isinstance(res, dict) else None
+    if sys_id is None:
+        sys_id = record.get_one(fields=['sys_id'])['sys_id']
+    if isinstance(sys_id, dict):
+        sys_id = sys_id.get('value')
+    return sys_id
+
+
+def attach_files(module, result, table, sys_id, attach):
+    ''' Upload the attachments, record their outcome in result, fail when any failed '''
+    files = Attachments(module, attach).run(table, sys_id)
+    result['attached_files'] = files
+    if any(item['changed'] for item in files):
+        result['changed'] = True
+    if len(files) == 1 and files[0].get('attachment'):
+        result['attached_file'] = files[0]['attachment']
+    if any(item['failed'] for item in files):
+        module.fail_json(msg='Failed to attach some files', **result)
+
 
 def run_module():
     # define the available arguments/parameters that a user can pass to
@@ -173,22 +704,49 @@ def run_module():
         number=dict(default=None, required=False, type='str'),
         data=dict(default=None, requried=False, type='dict'),
         lookup_field=dict(default='number', required=False, type='str'),
-        attachment=dict(default=None, required=False, type='str')
+        attachment=dict(default=None, required=False, type='list'),
+        return_fields=dict(default=None, type='list', required=False),
+        records=dict(default=None, type='list', required=False),
+        chunk_size=dict(default=100, type='int', required=False),
+        concurrency=dict(default=4, type='int', required=False),
+        use_batch_api=dict(default=True, type='bool', required=False),
     )
-    module_required_if = [
-        ['state', 'absent', ['number']],
+    module_args.update(sysparm_argument_spec())
+    module_mutually_exclusive = [
+        ['records', 'number'],
+        ['records', 'data'],
+        ['records', 'attachment'],
     ]
 
     module = AnsibleModule(
         argument_spec=module_args,
         supports_check_mode=True,
-        required_if=module_required_if
+        mutually_exclusive=module_mutually_exclusive
     )
 
     # check for pysnow
     if not HAS_PYSNOW:
         module.fail_json(msg='pysnow module required')
 
+    if module.params['state'] == 'absent' and not module.params['number'] and module.params['records'] is None:
+        module.fail_json(msg='state is absent but all of the following are missing: number')
+
+    if module.params['records'] is not None:
+        if module.params['chunk_size'] < 1:
+            module.fail_json(msg='chunk_size must be at least 1')
+        if module.params['concurrency'] < 1:
+            module.fail_json(msg='concurrency must be at least 1')
+        sysparms = request_params(module.params)
+        fields = return_projection(module.params)
+        if fields:
+            sysparms['sysparm_fields'] = ','.join(fields)
+        items = BulkRecords(module, sysparms).run()
+        result = dict(changed=any(item['changed'] for item in items), records=items,
+                      instance=module.params['instance'])
+        if any(item['failed'] for item in items):
+            module.fail_json(msg='Failed to apply some record operations', **result)
+        module.exit_json(**result)
+
     params = module.params
     instance = params['instance']
     username = params['username']
@@ -210,17 +768,31 @@ def run_module():
     # check for attachments
     if params['attachment'] is not None:
         attach = params['attachment']
-        b_attach = to_bytes(attach, errors='surrogate_or_strict')
-        if not os.path.exists(b_attach):
-            module.fail_json(msg="Attachment {0} not found".format(attach))
+        for path in attach:
+            if not os.path.isfile(to_bytes(path, errors='surrogate_or_strict')):
+                module.fail_json(msg="Attachment {0} not found".format(path))
+        if params['concurrency'] < 1:
+            module.fail_json(msg='concurrency must be at least 1')
         result['attachment'] = attach
     else:
         attach = None
 
     # Connect to ServiceNow
+    # pysnow applies request_params to every GET, including the ones behind
+    # update() and delete(), so the return_fields projection stays out of them
+    fields = return_projection(params)
+    sysparms = request_params(params)
+    write_params = dict(sysparms)
+    if fields:
+        write_params['sysparm_fields'] = ','.join(fields)
+    table_url = 'https://%s.service-now.com/api/now/table/%s' % (instance, table)
     try:
         conn = pysnow.Client(instance=instance, user=username,
-                             password=password)
+                             password=password, request_params=sysparms)
+        # data may hold raw or display values, so the record it is compared with is read in both forms
+        read_conn = pysnow.Client(instance=instance, session=conn.session,
+                                  request_params=dict(sysparms, sysparm_display_value='all'))
+        session = rest_session(params)
     except Exception as detail:
         module.fail_json(msg='Could not connect to ServiceNow: {0}'.format(str(detail)), **result)
 
@@ -249,16 +821,27 @@ def run_module():
         else:
             try:
                 record = conn.query(table=table, query={lookup_field: number})
-                res = record.get_one()
-                for key, value in data.items():
-                    res[key] = value
-                    result['changed'] = True
+                if data:
+                    current = read_conn.query(table=table, query={lookup_field: number})
+                    current = current.get_one(fields=list(data.keys()) + ['sys_id'])
+                    changes = diff_record(current, data)
+                    res = record_as(current, params['display_value'])
+                    if changes:
+                        result['changed'] = True
+                        result['diff'] = dict(before=dict((k, res.get(k)) for k in changes), after=changes)
+                    res.update(changes)
+                else:
+                    res = record.get_one(fields=fields or list())
                 result['record'] = res
+                if attach is not None:
+                    sys_id = record_sys_id(record, res)
             except pysnow.exceptions.NoResults:
                 snow_error = "Record does not exist"
                 module.fail_json(msg=snow_error, **result)
             except Exception as detail:
                 module.fail_json(msg="Unknown failure in query record: {0}".format(str(detail)), **result)
+            if attach is not None:
+                attach_files(module, result, table, sys_id, attach)
         module.exit_json(**result)
 
     # now for the real thing: (non-check mode)
@@ -266,9 +849,10 @@ def run_module():
     # are we creating a new record?
     if state == 'present' and number is None:
         try:
-            record = conn.insert(table=table, payload=dict(data))
-        except pysnow.UnexpectedResponse as e:
-            snow_error = "Failed to create record: {0}, details: {1}".format(e.error_summary, e.error_details)
+            # sent directly, pysnow's insert() has no way to project the echoed record
+            record = table_write(session, 'POST', table_url, dict(data), write_params)
+        except Exception as detail:
+            snow_error = "Failed to create record: {0}".format(to_native(detail))
             module.fail_json(msg=snow_error, **result)
         result['record'] = record
         result['changed'] = True
@@ -296,17 +880,24 @@ def run_module():
     else:
         try:
             record = conn.query(table=table, query={lookup_field: number})
-            if data is not None:
-                res = record.update(dict(data))
+            if data:
+                # one projected read, then only write the fields that differ
+                current = read_conn.query(table=table, query={lookup_field: number})
+                current = current.get_one(fields=list(data.keys()) + ['sys_id'])
+                changes = diff_record(current, data)
+                res = record_as(current, params['display_value'])
+                if changes:
+                    result['diff'] = dict(before=dict((k, res.get(k)) for k in changes), after=changes)
+                    sys_id = record_sys_id(record, current)
+                    # pysnow's update() would look the record up again, PATCH it by sys_id instead
+                    res = table_write(session, 'PATCH', table_url + '/' + sys_id, changes, write_params)
+                    result['changed'] = True
                 result['record'] = res
-                result['changed'] = True
             else:
-                res = record.get_one()
+                res = record.get_one(fields=fields or list())
                 result['record'] = res
             if attach is not None:
-                res = record.attach(b_attach)
-                result['changed'] = True
-                result['attached_file'] = res
+                sys_id = record_sys_id(record, res)
 
         except pysnow.exceptions.MultipleResults:
             snow_error = "Multiple record match"
@@ -320,6 +911,8 @@ def run_module():
         except Exception as detail:
             snow_error = "Failed to update record: {0}".format(str(detail))
             module.fail_json(msg=snow_error, **result)
+        if attach is not None:
+            attach_files(module, result, table, sys_id, attach)
 
     module.exit_json(**result)
 
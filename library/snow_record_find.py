@@ -61,6 +61,47 @@ options:
             - Fields of the record to return in the json
         required: false
         default: all fields
+    paging:
+        description:
+            - C(none) returns at most C(max_records) records in a single request.
+            - C(offset) walks every matching record, C(page_size) at a time, with
+              C(sysparm_offset). Pages can be fetched concurrently, see C(concurrency).
+            - C(keyset) walks every matching record in C(sys_id) order, asking for the
+              records after the last C(sys_id) seen. It is sequential, but stays
+              consistent while records are inserted or deleted. C(order_by) is ignored.
+            - C(max_records) is ignored when paging.
+            - With C(no_count), C(offset) fetches pages one at a time, as it cannot plan from the total.
+        required: false
+        default: none
+        choices: [ none, offset, keyset ]
+        version_added: "2.5"
+    page_size:
+        description:
+            - Number of records requested per page when paging.
+        required: false
+        default: 1000
+        version_added: "2.5"
+    concurrency:
+        description:
+            - Number of pages fetched at the same time with C(paging=offset).
+        required: false
+        default: 1
+        version_added: "2.5"
+    output:
+        description:
+            - Path of a file, on the host running the module, the records are streamed to
+              page by page instead of being returned. Only a summary is returned.
+        required: false
+        version_added: "2.5"
+    output_format:
+        description:
+            - Format of C(output), one JSON record per line, or CSV with one column per
+              field of C(return_fields), or of the first record when not set.
+        required: false
+        default: ndjson
+        choices: [ ndjson, csv ]
+        version_added: "2.5"
+extends_documentation_fragment: snow_sysparm
 
 requirements:
     - python pysnow (pysnow)
@@ -108,20 +149,62 @@ EXAMPLES = '''
       - sys_created_by
       - description
       - short_description
+
+- name: Dump every server CI to a file, 4 pages at a time
+  snow_record_find:
+    username: ansible_test
+    password: my_password
+    instance: dev99999
+    table: cmdb_ci_server
+    query:
+      operational_status: "1"
+    return_fields:
+      - sys_id
+      - name
+      - ip_address
+    paging: offset
+    page_size: 2000
+    concurrency: 4
+    output: /srv/cmdb/cmdb_ci_server.csv
+    output_format: csv
+  delegate_to: localhost
 '''
 
 RETURN = '''
 record:
     description: The full contents of the matching ServiceNow records as a list of records.
     type: dict
-    returned: always
+    returned: when output is not set
+count:
+    description: Number of records found
+    type: int
+    returned: when paging or output is set
+    sample: 204817
+pages:
+    description: Number of pages requested
+    type: int
+    returned: when paging or output is set
+    sample: 205
+output:
+    description: Path of the file the records were written to
+    type: str
+    returned: when output is set
+    sample: /srv/cmdb/cmdb_ci_server.ndjson
 '''
 
+import csv
+import json
+import os
+import threading
+
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils._text import to_native
+from ansible.module_utils.snow_common import SessionPool, request_params, sysparm_argument_spec
 # Pull in pysnow
 HAS_PYSNOW = False
 try:
     import pysnow
+    import requests
     from pysnow.exceptions import NoResults
     HAS_PYSNOW = True
 
@@ -197,6 +280,159 @@ class BuildQuery(object):
         return (self.qb)
 
 
+
+class RecordWriter(object):
+    '''
+    Writes records to a temporary file next to path as NDJSON or CSV, and
+    moves it into place once complete.
+    '''
+
+    def __init__(self, module, path, fmt, fields):
+        self.module = module
+        self.path = path
+        self.fmt = fmt
+        self.fields = fields
+        self.tmp = '%s.%d.tmp' % (path, os.getpid())
+        self.f = open(self.tmp, 'w')
+        self.csv = None
+
+    def write(self, records):
+        for record in records:
+            if self.fmt == 'ndjson':
+                self.f.write(json.dumps(record) + '\n')
+                continue
+            if self.csv is None:
+                self.csv = csv.DictWriter(self.f, fieldnames=self.fields or sorted(record.keys()),
+                                          extrasaction='ignore')
+                self.csv.writeheader()
+            # reference fields come back as a dict with a link and a value
+            self.csv.writerow(dict((k, v.get('value') if isinstance(v, dict) else v) for k, v in record.items()))
+
+    def close(self):
+        self.f.close()
+        self.module.atomic_move(self.tmp, self.path)
+
+    def abort(self):
+        self.f.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+
+class RecordPager(object):
+    '''
+    Walks every record matching a query with the Table API, page by page,
+    with sysparm_offset or keyset paging on sys_id.
+    '''
+
+    def __init__(self, module, query):
+        self.module = module
+        self.params = module.params
+        self.sessions = SessionPool(self.new_session)
+        self.lock = threading.Lock()
+        self.url = 'https://%s.service-now.com/api/now/table/%s' % (self.params['instance'], self.params['table'])
+        self.query = str(query)
+        self.fields = self.params['return_fields']
+        self.page_size = self.params['page_size']
+        self.pages = 0
+
+    def new_session(self):
+        session = requests.Session()
+        session.auth = (self.params['username'], self.params['password'])
+        return session
+
+    def get_page(self, query, offset=None, fields=None):
+        ''' Return (records, X-Total-Count or None) '''
+        params = request_params(self.params)
+        params.update(sysparm_query=query, sysparm_limit=self.page_size)
+        fields = fields or self.fields
+        if fields:
+            params['sysparm_fields'] = ','.join(fields)
+        if offset is not None:
+            params['sysparm_offset'] = offset
+        with self.sessions.session() as session:
+            response = session.get(self.url, params=params, headers={'Accept': 'application/json'})
+        with self.lock:
+            self.pages += 1
+        if response.status_code == 404:
+            # older releases answer an empty page with 404
+            return [], 0
+        response.raise_for_status()
+        return response.json().get('result', []), response.headers.get('X-Total-Count')
+
+    def order_clause(self):
+        order_by = self.params['order_by']
+        if order_by.startswith('-'):
+            return 'ORDERBYDESC' + order_by[1:]
+        return 'ORDERBY' + order_by.lstrip('+')
+
+    def join(self, *parts):
+        return '^'.join(part for part in parts if part)
+
+    def offset_pages(self):
+        ''' Yield pages in order, fetching up to concurrency of them at a time '''
+        query = self.join(self.query, self.order_clause())
+        page, total = self.get_page(query, 0)
+        yield page
+        if total is None:
+            # no total to plan with, walk until a short page
+            offset = len(page)
+            while len(page) == self.page_size:
+                page, total = self.get_page(query, offset)
+                offset += len(page)
+                yield page
+            return
+
+        offsets = list(range(self.page_size, int(total), self.page_size))
+        concurrency = self.params['concurrency']
+        for start in range(0, len(offsets), concurrency):
+            batch = offsets[start:start + concurrency]
+            pages = dict()
+            errors = []
+
+            def fetch(offset):
+                try:
+                    pages[offset] = self.get_page(query, offset)[0]
+                except Exception as detail:
+                    errors.append(detail)
+
+            threads = [threading.Thread(target=fetch, args=(offset,)) for offset in batch]
+            for t in threads:
+                t.daemon = True
+                t.start()
+            for t in threads:
+                t.join()
+            if errors:
+                raise errors[0]
+            for offset in batch:
+                yield pages[offset]
+
+    def keyset_pages(self):
+        ''' Yield pages in sys_id order, each asking for the records after the last one seen '''
+        fields = self.fields
+        strip = fields and 'sys_id' not in fields
+        if strip:
+            fields = fields + ['sys_id']
+        last = None
+        while True:
+            query = self.join(self.query, 'sys_id>%s' % last if last else '', 'ORDERBYsys_id')
+            page = self.get_page(query, fields=fields)[0]
+            if page:
+                last = page[-1]['sys_id']
+                if isinstance(last, dict):
+                    last = last['value']
+                if strip:
+                    for record in page:
+                        del record['sys_id']
+                yield page
+            if len(page) < self.page_size:
+                return
+
+    def walk(self):
+        if self.params['paging'] == 'keyset':
+            return self.keyset_pages()
+        return self.offset_pages()
+
+
 def run_module():
     # define the available arguments/parameters that a user can pass to
     # the module
@@ -208,8 +444,14 @@ def run_module():
         query=dict(default=None, type='dict', required=True),
         max_records=dict(default=20, type='int', required=False),
         order_by=dict(default='-created_on', type='str', required=False),
-        return_fields=dict(default=None, type='list', required=False)
+        return_fields=dict(default=None, type='list', required=False),
+        paging=dict(default='none', type='str', required=False, choices=['none', 'offset', 'keyset']),
+        page_size=dict(default=1000, type='int', required=False),
+        concurrency=dict(default=1, type='int', required=False),
+        output=dict(default=None, type='path', required=False),
+        output_format=dict(default='ndjson', type='str', required=False, choices=['ndjson', 'csv']),
     )
+    module_args.update(sysparm_argument_spec())
 
     module = AnsibleModule(
         argument_spec=module_args,
@@ -229,11 +471,44 @@ def run_module():
         return_fields=module.params['return_fields']
     )
 
+    if module.params['page_size'] < 1:
+        module.fail_json(msg='page_size must be at least 1', **result)
+    if module.params['concurrency'] < 1:
+        module.fail_json(msg='concurrency must be at least 1', **result)
+
+    if module.params['paging'] != 'none':
+        pager = RecordPager(module, BuildQuery(module).build_query())
+        writer = None
+        records = []
+        result['count'] = 0
+        try:
+            if module.params['output']:
+                writer = RecordWriter(module, module.params['output'], module.params['output_format'],
+                                      module.params['return_fields'])
+            for page in pager.walk():
+                result['count'] += len(page)
+                if writer:
+                    writer.write(page)
+                else:
+                    records.extend(page)
+        except Exception as detail:
+            if writer:
+                writer.abort()
+            module.fail_json(msg='Failed to find records: {0}'.format(to_native(detail)), **result)
+        result['pages'] = pager.pages
+        if writer:
+            writer.close()
+            result['output'] = module.params['output']
+        else:
+            result['record'] = records
+        module.exit_json(**result)
+
     # do the lookup
     try:
         conn = pysnow.Client(instance=module.params['instance'],
                              user=module.params['username'],
-                             password=module.params['password'])
+                             password=module.params['password'],
+                             request_params=request_params(module.params))
     except Exception as detail:
         module.fail_json(msg='Could not connect to ServiceNow: {0}'.format(str(detail)), **result)
 
@@ -249,9 +524,27 @@ def run_module():
         else:
             res = record.get_multiple(limit=module.params['max_records'],
                                       order_by=[module.params['order_by']])
-    except:
+    except Exception as detail:
         module.fail_json(msg='Failed to find record: {0}'.format(str(detail)), **result)
 
+    if module.params['output']:
+        writer = RecordWriter(module, module.params['output'], module.params['output_format'],
+                              module.params['return_fields'])
+        result['count'] = 0
+        try:
+            for record in res:
+                writer.write([record])
+                result['count'] += 1
+        except NoResults:
+            pass
+        except Exception as detail:
+            writer.abort()
+            module.fail_json(msg='Failed to find record: {0}'.format(to_native(detail)), **result)
+        writer.close()
+        result['pages'] = 1
+        result['output'] = module.params['output']
+        module.exit_json(**result)
+
     try:
         result['record'] = list(res)
     except NoResults:
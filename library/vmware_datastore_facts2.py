@@ -15,7 +15,7 @@ ANSIBLE_METADATA = {'metadata_version': '1.1',
 
 DOCUMENTATION = '''
 ---
-module: vmware_datastore_facts
+module: vmware_datastore_facts2
 short_description: Gather facts about datastores
 description:
     - Gather facts about datastores in VMWare
@@ -40,12 +40,37 @@ options:
             - Cluster to search for datastores
             - This is required if datacenter is not supplied
         required: False
+   cache:
+        description:
+            - Cache the datastore summary list on the controller, keyed by vCenter
+              hostname, datacenter and cluster.
+            - Repeated calls for the same datacenter within C(cache_ttl) seconds
+              are answered from the cache without connecting to vCenter.
+        required: False
+        default: False
+        type: bool
+   cache_ttl:
+        description:
+            - Number of seconds a cached datastore summary list stays valid.
+        required: False
+        default: 300
+   cache_refresh:
+        description:
+            - Ignore any cached entry, scan vCenter and rewrite the cache.
+        required: False
+        default: False
+        type: bool
+   cache_dir:
+        description:
+            - Directory on the controller used to store cached datastore summaries.
+        required: False
+        default: ~/.ansible/tmp/vmware_datastore_facts2
 extends_documentation_fragment: vmware.documentation
 '''
 
 EXAMPLES = '''
 - name: Gather facts from standalone ESXi server having datacenter as 'ha-datacenter'
-  vmware_datastore_facts:
+  vmware_datastore_facts2:
     hostname: 192.168.1.209
     username: administrator@vsphere.local
     password: vmware
@@ -53,6 +78,18 @@ EXAMPLES = '''
     validate_certs: no
   delegate_to: localhost
   register: facts
+
+- name: Gather datastore facts, reusing a scan made in the last 10 minutes
+  vmware_datastore_facts2:
+    hostname: 192.168.1.209
+    username: administrator@vsphere.local
+    password: vmware
+    datacenter: ha-datacenter
+    validate_certs: no
+    cache: yes
+    cache_ttl: 600
+  delegate_to: localhost
+  register: facts
 '''
 
 RETURN = """
@@ -61,6 +98,11 @@ instance:
     returned: always
     type: dict
     sample: None
+cache:
+    description: cache status, when C(cache) is enabled
+    returned: when cache is enabled
+    type: dict
+    sample: {"hit": true, "age": 42}
 """
 
 # try:
@@ -76,6 +118,7 @@ from ansible.module_utils._text import to_text
 from ansible.module_utils.vmware import (connect_to_api, vmware_argument_spec,
                                          get_all_objs, HAS_PYVMOMI, find_obj,
                                          find_cluster_by_name)
+from ansible.module_utils.vmware_datastore_cache import DatastoreSummaryCache
 
 
 class PyVmomiCache(object):
@@ -142,20 +185,7 @@ class PyVmomiHelper(object):
         return c_dc
 
 
-def main():
-    argument_spec = vmware_argument_spec()
-    argument_spec.update(
-        name=dict(type='str'),
-        datacenter=dict(type='str'),
-        cluster=dict(type='str')
-    )
-    module = AnsibleModule(argument_spec=argument_spec,
-                           required_one_of=[
-                               ['cluster', 'datacenter'],
-                           ],
-                           )
-    result = dict(changed=False)
-
+def gather_datastores(module):
     pyv = PyVmomiHelper(module)
 
     if module.params['cluster']:
@@ -178,6 +208,44 @@ def main():
         dds['url'] = summary.url
         # Calculated values
         dds['provisioned'] = summary.capacity - summary.freeSpace + summary.uncommitted
+        datastores.append(dds)
+    return datastores
+
+
+def main():
+    argument_spec = vmware_argument_spec()
+    argument_spec.update(
+        name=dict(type='str'),
+        datacenter=dict(type='str'),
+        cluster=dict(type='str'),
+        cache=dict(type='bool', default=False),
+        cache_ttl=dict(type='int', default=300),
+        cache_refresh=dict(type='bool', default=False),
+        cache_dir=dict(type='path', default='~/.ansible/tmp/vmware_datastore_facts2'),
+    )
+    module = AnsibleModule(argument_spec=argument_spec,
+                           required_one_of=[
+                               ['cluster', 'datacenter'],
+                           ],
+                           )
+    result = dict(changed=False)
+
+    dxs = None
+    if module.params['cache']:
+        cache = DatastoreSummaryCache(module, 'vmware_datastore_facts2')
+        if not module.params['cache_refresh']:
+            dxs, age = cache.get()
+        if dxs is None:
+            dxs = gather_datastores(module)
+            cache.set(dxs)
+            result['cache'] = dict(hit=False, age=0)
+        else:
+            result['cache'] = dict(hit=True, age=age)
+    else:
+        dxs = gather_datastores(module)
+
+    datastores = list()
+    for dds in dxs:
         if module.params['name']:
             if dds['name'] == module.params['name']:
                 datastores.extend([dds])
@@ -0,0 +1,279 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright: (c) 2017, Tim Rightnour (thegarbledone@gmail.com)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: vmware_datastore_orphans
+short_description: Find files on a datastore that no virtual machine references
+description:
+- List the contents of one or more datastores with the datastore browser and
+  report every file that is not part of the layout of any virtual machine or template.
+- The datastore is walked one top level folder at a time, so only a single
+  folder listing is held in memory at once.
+- The files referenced by the virtual machines of the datacenter are fetched
+  with a single paged PropertyCollector retrieval and kept in a set, so matching
+  is linear in the number of files.
+version_added: '2.5'
+author:
+- Tim Rightnour (@garbled1) <thegarbledone@gmail.com>
+requirements:
+- python >= 2.6
+- PyVmomi
+options:
+  datacenter:
+    description:
+    - Name of the datacenter holding the datastores.
+    - Datastore names are only unique within a datacenter, so both the datastores
+      and the virtual machines referencing them are looked up in this datacenter only.
+    required: True
+  datastore:
+    description:
+    - Name, or list of names, of the datastores to scan.
+    required: True
+  exclude:
+    description:
+    - List of shell style patterns, matched against the path relative to the
+      datastore root, of files that should never be reported.
+    default: []
+  skip_hidden:
+    description:
+    - Skip top level folders starting with a dot, such as C(.sdd.sf), C(.vSphere-HA) or C(.dvsData).
+    default: True
+    type: bool
+  page_size:
+    description:
+    - Maximum number of virtual machines returned per PropertyCollector page.
+    default: 1000
+extends_documentation_fragment: vmware.documentation
+'''
+
+EXAMPLES = r'''
+- name: Find orphaned files on a datastore
+  vmware_datastore_orphans:
+    hostname: 192.0.2.44
+    username: administrator@vsphere.local
+    password: vmware
+    validate_certs: no
+    datacenter: DC1
+    datastore: datastore1
+    exclude:
+    - 'iso/*'
+  delegate_to: localhost
+  register: orphans
+'''
+
+RETURN = r'''
+orphans:
+    description: files that are not referenced by any virtual machine
+    returned: always
+    type: list
+    sample: [{"path": "[datastore1] oldvm/oldvm-flat.vmdk", "size": 42949672960, "modification": "2017-10-11T09:52:12Z"}]
+total_size:
+    description: sum of the sizes of all orphaned files, in bytes
+    returned: always
+    type: int
+    sample: 42949672960
+files_scanned:
+    description: number of files listed on the datastores
+    returned: always
+    type: int
+    sample: 1024
+files_referenced:
+    description: number of distinct files referenced by virtual machines
+    returned: always
+    type: int
+    sample: 980
+'''
+
+import fnmatch
+import re
+
+try:
+    from pyVmomi import vim, vmodl
+except ImportError:
+    pass
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils._text import to_native
+from ansible.module_utils.vmware import (connect_to_api, vmware_argument_spec, find_datacenter_by_name,
+                                         HAS_PYVMOMI)
+from ansible.module_utils.vsphere_transfer import wait_for_task
+
+# Extent files that are implied by a referenced disk descriptor
+DISK_EXTENT_SUFFIXES = ('-flat.vmdk', '-delta.vmdk', '-sesparse.vmdk', '-ctk.vmdk', '-rdm.vmdk', '-rdmp.vmdk')
+
+DS_PATH_RE = re.compile(r'^\[([^\]]+)\]\s*(.*)$')
+
+
+def split_ds_path(path):
+    """ Split '[datastore] folder/file' into ('datastore', 'folder/file') """
+    match = DS_PATH_RE.match(path)
+    if not match:
+        return None, path
+    return match.group(1), match.group(2).strip('/')
+
+
+def normalize_ds_path(path):
+    """ Return a canonical '[datastore] folder/file' path used as a set key """
+    ds, rel = split_ds_path(path)
+    rel = re.sub('/+', '/', rel)
+    if ds is None:
+        return rel
+    return '[%s] %s' % (ds, rel)
+
+
+class OrphanFinder(object):
+    def __init__(self, module):
+        if not HAS_PYVMOMI:
+            module.fail_json(msg='PyVmomi Python module required. Install using "pip install PyVmomi"')
+
+        self.module = module
+        self.params = module.params
+        self.content = connect_to_api(self.module)
+        self.datacenter = find_datacenter_by_name(self.content, self.params['datacenter'])
+        if self.datacenter is None:
+            self.module.fail_json(msg='Failed to find datacenter "%s"' % self.params['datacenter'])
+
+    def retrieve_vm_files(self):
+        """ Yield the property sets of every datacenter virtual machine, one PropertyCollector page at a time """
+        view = self.content.viewManager.CreateContainerView(self.datacenter, [vim.VirtualMachine], True)
+        traversal = vmodl.query.PropertyCollector.TraversalSpec(name='traverseEntities', path='view',
+                                                                skip=False, type=vim.view.ContainerView)
+        obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal])
+        prop_spec = vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine,
+                                                               pathSet=['config.files.vmPathName', 'layoutEx.file'])
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=[obj_spec], propSet=[prop_spec])
+        options = vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=self.params['page_size'])
+
+        pc = self.content.propertyCollector
+        try:
+            result = pc.RetrievePropertiesEx([filter_spec], options)
+            while result:
+                for obj in result.objects:
+                    yield obj.propSet
+                if not result.token:
+                    break
+                result = pc.ContinueRetrievePropertiesEx(result.token)
+        finally:
+            view.Destroy()
+
+    def referenced_files(self):
+        """ Build the set of every file referenced by any virtual machine layout """
+        referenced = set()
+        for prop_set in self.retrieve_vm_files():
+            for prop in prop_set:
+                if prop.name == 'config.files.vmPathName':
+                    names = [prop.val]
+                else:
+                    names = [f.name for f in prop.val]
+                for name in names:
+                    if not name:
+                        continue
+                    path = normalize_ds_path(name)
+                    referenced.add(path)
+                    if path.endswith('.vmdk'):
+                        base = path[:-len('.vmdk')]
+                        for suffix in DISK_EXTENT_SUFFIXES:
+                            referenced.add(base + suffix)
+        return referenced
+
+    def search(self, ds, path, recurse):
+        spec = vim.host.DatastoreBrowser.SearchSpec(
+            details=vim.host.DatastoreBrowser.FileInfo.Details(fileType=True, fileSize=True, modification=True),
+        )
+        if recurse:
+            task = ds.browser.SearchDatastoreSubFolders_Task(datastorePath=path, searchSpec=spec)
+        else:
+            task = ds.browser.SearchDatastore_Task(datastorePath=path, searchSpec=spec)
+        try:
+            wait_for_task(task)
+        except Exception as exc:
+            self.module.fail_json(msg="Failed to search %s: %s" % (path, to_native(exc)))
+        result = task.info.result
+        if recurse:
+            return result or []
+        return [result] if result else []
+
+    def list_datastore(self, ds):
+        """ Yield (path, fileinfo) for every file on the datastore, one top level folder per search task """
+        root = '[%s]' % ds.name
+        for listing in self.search(ds, root, recurse=False):
+            folders = []
+            for info in listing.file or []:
+                if isinstance(info, vim.host.DatastoreBrowser.FolderInfo):
+                    folders.append(info.path)
+                else:
+                    yield normalize_ds_path('%s %s' % (root, info.path)), info
+            for folder in folders:
+                if self.params['skip_hidden'] and folder.startswith('.'):
+                    continue
+                for page in self.search(ds, '%s %s' % (root, folder), recurse=True):
+                    folder_path = page.folderPath
+                    for info in page.file or []:
+                        if isinstance(info, vim.host.DatastoreBrowser.FolderInfo):
+                            continue
+                        yield normalize_ds_path('%s/%s' % (folder_path, info.path)), info
+
+    def find_orphans(self):
+        ds_objs = []
+        datastores = dict((ds.name, ds) for ds in self.datacenter.datastore)
+        for name in self.params['datastore']:
+            if name not in datastores:
+                self.module.fail_json(msg='Failed to find datastore "%s" in datacenter "%s"'
+                                          % (name, self.params['datacenter']))
+            ds_objs.append(datastores[name])
+
+        referenced = self.referenced_files()
+
+        result = dict(changed=False, orphans=[], total_size=0, files_scanned=0,
+                      files_referenced=len(referenced))
+        for ds in ds_objs:
+            for path, info in self.list_datastore(ds):
+                result['files_scanned'] += 1
+                if path in referenced:
+                    continue
+                rel = split_ds_path(path)[1]
+                if any(fnmatch.fnmatch(rel, pattern) for pattern in self.params['exclude']):
+                    continue
+                size = info.fileSize or 0
+                modification = None
+                if info.modification:
+                    modification = info.modification.strftime('%Y-%m-%dT%H:%M:%SZ')
+                result['orphans'].append(dict(path=path, size=size, modification=modification))
+                result['total_size'] += size
+        return result
+
+
+def main():
+    argument_spec = vmware_argument_spec()
+    argument_spec.update(
+        datacenter=dict(type='str', required=True),
+        datastore=dict(type='list', required=True),
+        exclude=dict(type='list', default=[]),
+        skip_hidden=dict(type='bool', default=True),
+        page_size=dict(type='int', default=1000),
+    )
+
+    module = AnsibleModule(argument_spec=argument_spec,
+                           supports_check_mode=True,
+                           )
+
+    finder = OrphanFinder(module)
+    result = finder.find_orphans()
+
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
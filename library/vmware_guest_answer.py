@@ -19,6 +19,9 @@ short_description: Check for and answer questions blocking a guest
 description:
 - Check for questions that may be blocking a vm from operating
 - Answer questions that may be blocking a vm from operating
+- With C(rules), every virtual machine with a pending question is found with a single
+  PropertyCollector query on C(runtime.question), and the questions matching a rule
+  are answered concurrently.
 version_added: '2.5'
 author:
 - Tim Rightnour (@garbled1) <thegarbledone@gmail.com>
@@ -58,53 +61,185 @@ options:
     default: /vm
   question:
     description:
-    - A string matching the question to be answered
-    required: True
+    - The question to answer on the virtual machine given with C(name) or C(uuid).
+    - Matches the question id, or is a regular expression searched for in the question text.
   answer:
     description:
-    - A string matching the answer you wish to provide to the virtual machine
-    required: True
+    - The answer to give, matched against the key, label or summary of the choices offered.
+    - Required with C(question).
+  rules:
+    description:
+    - List of rules to answer the pending questions of every virtual machine in the inventory.
+    - Each rule is a dict with a C(question) regular expression, searched for case
+      insensitively in the question text, and the C(answer) to give. The first matching rule wins.
+    - Questions matching no rule are reported and left alone.
+    - Mutually exclusive with C(name), C(uuid) and C(question).
+    version_added: '2.5'
+  concurrency:
+    description:
+    - Number of virtual machines answered at the same time with C(rules).
+    default: 10
+    version_added: '2.5'
 extends_documentation_fragment: vmware.documentation
 '''
 
 EXAMPLES = r'''
-- name: Take a screenshot of a vm
-  vmware_guest_screenshot:
+- name: Answer the question blocking a vm
+  vmware_guest_answer:
     hostname: 192.0.2.44
     username: administrator@vsphere.local
     password: vmware
     validate_certs: no
     folder: /testvms
     name: testvm_2
+    question: 'moved or copied'
+    answer: 'I Moved It'
+  delegate_to: localhost
+
+- name: Answer every pending moved or copied question after a storage outage
+  vmware_guest_answer:
+    hostname: 192.0.2.44
+    username: administrator@vsphere.local
+    password: vmware
+    validate_certs: no
+    rules:
+    - question: 'may have been moved or copied'
+      answer: 'I Moved It'
+    - question: 'no more space for virtual disk'
+      answer: 'Retry'
+    concurrency: 25
   delegate_to: localhost
-  register: screenshot
+  register: answered
+'''
+
+RETURN = r'''
+answer:
+    description: outcome for the virtual machine given with name or uuid
+    returned: when a matching question was answered
+    type: dict
+    sample: {"name": "testvm_2", "question_id": "_vmx1", "answer": "I Moved It", "choice": "1", "changed": true, "failed": false}
+answers:
+    description: per virtual machine outcome
+    returned: always
+    type: list
+    sample: [{"name": "testvm_2", "question_id": "_vmx1", "question": "This virtual machine might have been moved or copied...",
+              "answer": "I Moved It", "choice": "1", "changed": true, "failed": false}]
 '''
 
-RETURN = r''' # '''
+import re
+import threading
+
+try:
+    from pyVmomi import vim, vmodl
+except ImportError:
+    pass
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.vmware import PyVmomi, vmware_argument_spec, wait_for_task
+from ansible.module_utils.six.moves import queue
+from ansible.module_utils._text import to_native
+from ansible.module_utils.vmware import PyVmomi, vmware_argument_spec
 
 
-def answer_vm(vm, question, answer):
-    task = None
-    try:
-        task = vm.AnswerVM(question, answer)
-    except vim.fault.ConcurentAccess, vim.fault.RuntimeFault as ex:
-        self.module_fail_json(msg="Failed to answer: %s" % to_native(ex.msg))
-    except vim.fault.InvalidArgument:
-        self.module.exit_json(changed=False, msg='Question already answered')
-    except Exception as ex:
-        self.module.fail_json(msg="Failed to answer due to %s" % to_native(ex.msg))
-
-    result = dict()
-    if task:
+def find_choice(question, answer):
+    """ Return the ElementDescription of the choice matching answer by key, label or summary, or None """
+    wanted = answer.lower()
+    for choice in question.choice.choiceInfo:
+        if wanted in (choice.key.lower(), (choice.label or '').lower(), (choice.summary or '').lower()):
+            return choice
+    return None
+
+
+class AnswerHelper(PyVmomi):
+    def pending_questions(self):
+        """ Return (vm, name, question) for every virtual machine with a pending question, in one query """
+        view = self.content.viewManager.CreateContainerView(self.content.rootFolder, [vim.VirtualMachine], True)
+        traversal = vmodl.query.PropertyCollector.TraversalSpec(name='traverseEntities', path='view',
+                                                                skip=False, type=vim.view.ContainerView)
+        obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal])
+        prop_spec = vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine,
+                                                               pathSet=['name', 'runtime.question'])
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=[obj_spec], propSet=[prop_spec])
+
+        pc = self.content.propertyCollector
+        pending = []
+        try:
+            result = pc.RetrievePropertiesEx([filter_spec], vmodl.query.PropertyCollector.RetrieveOptions())
+            while result:
+                for obj in result.objects:
+                    props = dict((prop.name, prop.val) for prop in obj.propSet)
+                    if props.get('runtime.question'):
+                        pending.append((obj.obj, props.get('name'), props['runtime.question']))
+                if not result.token:
+                    break
+                result = pc.ContinueRetrievePropertiesEx(result.token)
+        finally:
+            view.Destroy()
+        return pending
+
+    def answer_vm(self, vm, name, question, answer):
+        """ Answer question on vm. Never raises, errors go into the result """
+        result = dict(name=name, question_id=question.id, question=question.text, changed=False, failed=False)
+        choice = find_choice(question, answer)
+        if choice is None:
+            result.update(failed=True, msg="'%s' is not one of the choices: %s" %
+                          (answer, ', '.join(c.label for c in question.choice.choiceInfo)))
+            return result
+        result.update(answer=choice.label, choice=choice.key, changed=True)
+        if self.module.check_mode:
+            return result
         try:
-            tr, result = wait_for_task(task)
+            vm.AnswerVM(question.id, choice.key)
+        except vim.fault.InvalidArgument:
+            result.update(changed=False, msg='Question already answered')
+        except vmodl.MethodFault as ex:
+            result.update(changed=False, failed=True, msg="Failed to answer: %s" % to_native(ex.msg))
         except Exception as ex:
-            self.module.fail_json(msg="Failed to answer due to %s" % to_native(ex.msg))
+            result.update(changed=False, failed=True, msg="Failed to answer due to %s" % to_native(ex))
+        return result
+
+    def match_rule(self, question):
+        for rule in self.rules:
+            if rule['regex'].search(question.text or ''):
+                return rule
+        return None
+
+    def answer_all(self):
+        """ Answer every pending question matching a rule, from concurrency worker threads """
+        self.rules = []
+        for rule in self.params['rules']:
+            if not isinstance(rule, dict) or not rule.get('question') or not rule.get('answer'):
+                self.module.fail_json(msg="Every rule needs a question and an answer: %s" % rule)
+            try:
+                self.rules.append(dict(regex=re.compile(rule['question'], re.I), answer=rule['answer']))
+            except re.error as ex:
+                self.module.fail_json(msg="Invalid question pattern '%s': %s" % (rule['question'], to_native(ex)))
+
+        work = queue.Queue()
+        results = []
+        for vm, name, question in self.pending_questions():
+            rule = self.match_rule(question)
+            if rule is None:
+                results.append(dict(name=name, question_id=question.id, question=question.text,
+                                    changed=False, failed=False, msg='No rule matches the question'))
+                continue
+            results.append(None)
+            work.put((len(results) - 1, vm, name, question, rule['answer']))
+
+        def worker():
+            while True:
+                try:
+                    index, vm, name, question, answer = work.get_nowait()
+                except queue.Empty:
+                    return
+                results[index] = self.answer_vm(vm, name, question, answer)
 
-    return result
+        threads = [threading.Thread(target=worker) for i in range(min(self.params['concurrency'], work.qsize()))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        return results
 
 
 def main():
@@ -114,30 +249,62 @@ def main():
         name_match=dict(type='str', choices=['first', 'last'], default='first'),
         uuid=dict(type='str'),
         folder=dict(type='str', default='/vm'),
-        question=dict(type='str', required=True),
-        answer=dict(type='str', required=True),
+        question=dict(type='str'),
+        answer=dict(type='str'),
+        rules=dict(type='list'),
+        concurrency=dict(type='int', default=10),
     )
 
     module = AnsibleModule(argument_spec=argument_spec,
-                           supports_check_mode=False,
+                           supports_check_mode=True,
                            mutually_exclusive=[
-                               ['name', 'uuid'],
+                               ['name', 'uuid', 'rules'],
+                               ['question', 'rules'],
+                           ],
+                           required_one_of=[
+                               ['name', 'uuid', 'rules'],
+                           ],
+                           required_together=[
+                               ['question', 'answer'],
                            ],
                            )
 
-    result = dict(changed=True,)
+    if module.params['concurrency'] < 1:
+        module.fail_json(msg="concurrency must be at least 1")
+
+    pyv = AnswerHelper(module)
+
+    if module.params['rules']:
+        answers = pyv.answer_all()
+        result = dict(changed=any(a['changed'] for a in answers), answers=answers)
+        if any(a['failed'] for a in answers):
+            module.fail_json(msg="Failed to answer some questions", **result)
+        module.exit_json(**result)
 
-    pyv = PyVmomi(module)
+    if not module.params['question']:
+        module.fail_json(msg="question and answer are required with name or uuid")
 
     # Check if the VM exists before continuing
     vm = pyv.get_vm()
-
-    if vm:
-        # VM exists
-        result['answer'] = answer_vm(vm=vm, question=module.params['question'], answer=module.params['answer'])
-    else:
+    if not vm:
         module.fail_json(msg="Unable to answer non-existing virtual machine : '%s'" % (module.params.get('uuid') or module.params.get('name')))
 
+    # VM exists
+    question = vm.runtime.question
+    if not question:
+        module.exit_json(changed=False, msg='No question pending', answers=[])
+    try:
+        matches = question.id == module.params['question'] or re.search(module.params['question'], question.text or '', re.I)
+    except re.error as ex:
+        module.fail_json(msg="Invalid question pattern '%s': %s" % (module.params['question'], to_native(ex)))
+    if not matches:
+        module.exit_json(changed=False, msg='The pending question does not match', answers=[
+            dict(name=vm.name, question_id=question.id, question=question.text, changed=False, failed=False)])
+
+    answer = pyv.answer_vm(vm, vm.name, question, module.params['answer'])
+    result = dict(changed=answer['changed'], answers=[answer], answer=answer)
+    if answer['failed']:
+        module.fail_json(msg=answer['msg'], **result)
     module.exit_json(**result)
 
 
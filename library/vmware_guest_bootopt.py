@@ -14,10 +14,13 @@ ANSIBLE_METADATA = {'metadata_version': '1.1',
 
 DOCUMENTATION = r'''
 ---
-module: vmware_guest_screenshot
-short_description: Takes a screenshot of a virtual machine
+module: vmware_guest_bootopt
+short_description: Manage the boot options of virtual machines
 description:
-- Take a screenshot from a virtual machine
+- Set the boot order, boot delay, boot retry and enter BIOS setup options of one or more virtual machines.
+- The devices and current boot options of all virtual machines are fetched in a single
+  PropertyCollector retrieval, and a single C(ReconfigVM_Task) is sent to each virtual
+  machine whose options differ from the requested ones.
 version_added: '2.5'
 author:
 - Tim Rightnour (@garbled1) <thegarbledone@gmail.com>
@@ -29,6 +32,10 @@ options:
     description:
     - Name of the virtual machine to work with.
     - Virtual machine names in vCenter are not necessarily unique, which may be problematic, see C(name_match).
+  names:
+    description:
+    - List of names of virtual machines in C(folder) to configure.
+    - Mutually exclusive with C(name) and C(uuid).
   name_match:
     description:
     - If multiple virtual machines matching the name, use the first or last found.
@@ -41,7 +48,7 @@ options:
   folder:
     description:
     - Destination folder, absolute or relative path to find an existing guest.
-    - The folder should include the datacenter. ESX's datacenter is ha-datacenter
+    - A path that does not start with the datacenter is looked up under the C(vm) folder of C(datacenter).
     - 'Examples:'
     - '   folder: /ha-datacenter/vm'
     - '   folder: ha-datacenter/vm'
@@ -55,67 +62,335 @@ options:
     - '   folder: vm/folder2'
     - '   folder: folder2'
     default: /vm
+  datacenter:
+    description:
+    - Datacenter holding C(folder) when C(folder) does not include it. ESX's datacenter is ha-datacenter.
+    default: ha-datacenter
+    version_added: '2.5'
+  bootdelay:
+    description:
+    - Delay in milliseconds before starting the boot sequence.
+  bootorder:
+    description:
+    - List of devices to boot from, in order.
+    - Each entry is C(cdrom), C(floppy), C(disk) for the first disk, C(ethernet) for the first
+      network adapter, or the label of a disk or network adapter, such as C(Hard disk 2) or
+      C(Network adapter 1).
+  bootretrydelay:
+    description:
+    - Delay in milliseconds before retrying the boot sequence when C(bootretry) is enabled.
+  bootretry:
+    description:
+    - Retry the boot sequence when no boot device was found.
+    type: bool
+  enterbios:
+    description:
+    - Enter BIOS setup on the next boot.
+    type: bool
+  concurrency:
+    description:
+    - Number of virtual machines reconfigured at the same time.
+    default: 10
+  timeout:
+    description:
+    - Seconds to wait for each reconfigure task to complete.
+    default: 120
+    version_added: '2.5'
 extends_documentation_fragment: vmware.documentation
 '''
 
 EXAMPLES = r'''
-- name: Take a screenshot of a vm
-  vmware_guest_screenshot:
+- name: Boot a vm from the network first
+  vmware_guest_bootopt:
     hostname: 192.0.2.44
     username: administrator@vsphere.local
     password: vmware
     validate_certs: no
     folder: /testvms
     name: testvm_2
+    bootorder:
+    - ethernet
+    - disk
   delegate_to: localhost
-  register: screenshot
-'''
-
-RETURN = r''' # '''
-
-from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.vmware import PyVmomi, vim, vmware_argument_spec, wait_for_task
-
 
-def get_boot_options_vm(vm):
-    result = dict(changed=False,)
+- name: PXE boot a set of vms for reimaging
+  vmware_guest_bootopt:
+    hostname: 192.0.2.44
+    username: administrator@vsphere.local
+    password: vmware
+    validate_certs: no
+    folder: /datacenter1/vm/reimage
+    names: "{{ groups['reimage'] }}"
+    bootorder:
+    - Network adapter 1
+    - Hard disk 1
+    bootdelay: 3000
+    concurrency: 25
+  delegate_to: localhost
+'''
 
-    if not vm.config.bootOptions:
-        return None
+RETURN = r'''
+bootopts:
+    description: boot options of the virtual machine after the change
+    returned: when a single virtual machine was given with name or uuid
+    type: dict
+    sample: {"bootdelay": 3000, "bootorder": ["Network adapter 1", "Hard disk 1"],
+             "bootretrydelay": 10000, "bootretry": false, "enterbios": false}
+hardware:
+    description: map of device names to their label, key and type
+    returned: when a single virtual machine was given with name or uuid
+    type: dict
+    sample: {"Hard disk 1": {"label": "Hard disk 1", "key": 2000, "type": "vim.vm.device.VirtualDisk"}}
+vms:
+    description: per virtual machine results, with the options before and after the change
+    returned: always
+    type: list
+    sample: [{"name": "testvm_2", "changed": true, "failed": false,
+              "diff": {"before": {"bootorder": ["Hard disk 1"]}, "after": {"bootorder": ["Network adapter 1", "Hard disk 1"]}}}]
+'''
 
-    bootopts = vm.config.bootOptions
+import threading
+import time
 
-    result['bootopts']['bootdelay'] = bootopts.bootDelay
-    result['bootopts']['bootorder'] = bootopts.bootOrder
-    result['bootopts']['bootretrydelay'] = bootopts.bootRetryDelay
-    result['bootopts']['bootretry'] = bootopts.bootRetryEnabled
-    result['bootopts']['enterbios'] = bootopts.enterBIOSSetup
+try:
+    from pyVmomi import vim, vmodl
+except ImportError:
+    pass
 
-    return result
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.six.moves import queue
+from ansible.module_utils._text import to_native
+from ansible.module_utils.vmware import PyVmomi, vmware_argument_spec
+from ansible.module_utils.vmware_folder import find_vm_folder
 
+PROPERTIES = ['name', 'config.hardware.device', 'config.bootOptions']
 
-def compare_boot_options(vim, result, params):
-    changed = 0
-    configspec = vim.vm.ConfigSpec()
+# module option name -> vim.vm.BootOptions property
+BOOT_OPTIONS = [
+    ('bootdelay', 'bootDelay'),
+    ('bootretrydelay', 'bootRetryDelay'),
+    ('bootretry', 'bootRetryEnabled'),
+    ('enterbios', 'enterBIOSSetup'),
+]
 
 
-def build_hardware_map(vm, vim):
-    devices = vm.config.hardware.device
+def build_hardware_map(devices):
     hwmap = dict()
 
     for dev in devices:
-        if type(dev) is vim.vm.device.VirtualCdrom:
+        if isinstance(dev, vim.vm.device.VirtualCdrom):
             dname = "cdrom"
         else:
             dname = dev.deviceInfo.label
         hwmap[dname] = {
             'label': dev.deviceInfo.label,
             'key': dev.key,
-            'type': str(type(dev)),
+            'type': type(dev).__name__,
         }
     return hwmap
 
 
+def boot_device_name(bootable, devices):
+    """ Return the bootorder name of a vim.vm.BootOptions.BootableDevice """
+    if isinstance(bootable, vim.vm.BootOptions.BootableCdromDevice):
+        return 'cdrom'
+    if isinstance(bootable, vim.vm.BootOptions.BootableFloppyDevice):
+        return 'floppy'
+    for dev in devices:
+        if dev.key == bootable.deviceKey:
+            return dev.deviceInfo.label
+    return 'key %s' % bootable.deviceKey
+
+
+def get_boot_options(bootopts, devices):
+    result = dict(bootdelay=None, bootorder=[], bootretrydelay=None, bootretry=None, enterbios=None)
+    if not bootopts:
+        return result
+
+    for option, prop in BOOT_OPTIONS:
+        result[option] = getattr(bootopts, prop)
+    result['bootorder'] = [boot_device_name(b, devices) for b in bootopts.bootOrder or []]
+    return result
+
+
+def build_boot_order(names, devices):
+    """ Turn bootorder names into (canonical names, BootableDevice list), raising on unknown devices """
+    disks = [dev for dev in devices if isinstance(dev, vim.vm.device.VirtualDisk)]
+    nics = [dev for dev in devices if isinstance(dev, vim.vm.device.VirtualEthernetCard)]
+    canonical = []
+    order = []
+    for name in names:
+        if name == 'cdrom':
+            canonical.append('cdrom')
+            order.append(vim.vm.BootOptions.BootableCdromDevice())
+            continue
+        if name == 'floppy':
+            canonical.append('floppy')
+            order.append(vim.vm.BootOptions.BootableFloppyDevice())
+            continue
+        if name == 'disk':
+            matches = disks[:1]
+        elif name == 'ethernet':
+            matches = nics[:1]
+        else:
+            matches = [dev for dev in disks + nics if dev.deviceInfo.label == name]
+        if not matches:
+            raise ValueError("No bootable device '%s'" % name)
+        dev = matches[0]
+        canonical.append(dev.deviceInfo.label)
+        if dev in disks:
+            order.append(vim.vm.BootOptions.BootableDiskDevice(deviceKey=dev.key))
+        else:
+            order.append(vim.vm.BootOptions.BootableEthernetDevice(deviceKey=dev.key))
+    return canonical, order
+
+
+def compare_boot_options(current, params, devices):
+    """
+    Diff the current boot options against the requested ones.
+
+    Return (before, after, vim.vm.BootOptions holding only the changed options or None)
+    """
+    before = dict()
+    after = dict()
+    bootopts = vim.vm.BootOptions()
+    for option, prop in BOOT_OPTIONS:
+        if params[option] is not None and params[option] != current[option]:
+            before[option] = current[option]
+            after[option] = params[option]
+            setattr(bootopts, prop, params[option])
+    if params['bootorder'] is not None:
+        canonical, order = build_boot_order(params['bootorder'], devices)
+        if canonical != current['bootorder']:
+            before['bootorder'] = current['bootorder']
+            after['bootorder'] = canonical
+            bootopts.bootOrder = order
+    if not after:
+        return before, after, None
+    return before, after, bootopts
+
+
+class BootOptHelper(PyVmomi):
+    def retrieve(self, vms=None, folder=None):
+        """ Return (vm, props) for vms, or for the virtual machines directly in folder, in a single retrieval """
+        view = None
+        if folder is not None:
+            view = self.content.viewManager.CreateContainerView(folder, [vim.VirtualMachine], False)
+            traversal = vmodl.query.PropertyCollector.TraversalSpec(name='traverseEntities', path='view',
+                                                                    skip=False, type=vim.view.ContainerView)
+            obj_specs = [vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal])]
+        else:
+            obj_specs = [vmodl.query.PropertyCollector.ObjectSpec(obj=vm) for vm in vms]
+        prop_spec = vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine, pathSet=PROPERTIES)
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=obj_specs, propSet=[prop_spec])
+
+        pc = self.content.propertyCollector
+        found = []
+        try:
+            result = pc.RetrievePropertiesEx([filter_spec], vmodl.query.PropertyCollector.RetrieveOptions())
+            while result:
+                for obj in result.objects:
+                    found.append((obj.obj, dict((prop.name, prop.val) for prop in obj.propSet)))
+                if not result.token:
+                    break
+                result = pc.ContinueRetrievePropertiesEx(result.token)
+        finally:
+            if view is not None:
+                view.Destroy()
+        return found
+
+    def select_vms(self):
+        """ Return the (vm, props) to configure, and results for the names that were not found """
+        if not self.params['names']:
+            # Check if the VM exists before continuing
+            vm = self.get_vm()
+            if not vm:
+                self.module.fail_json(msg="Unable to set boot options on non-existing virtual machine : '%s'" %
+                                      (self.params.get('uuid') or self.params.get('name')))
+            return self.retrieve(vms=[vm]), []
+
+        folder = find_vm_folder(self.module, self.content, self.params['folder'], self.params['datacenter'])
+        found = dict()
+        for vm, props in self.retrieve(folder=folder):
+            name = props.get('name')
+            if name in self.params['names'] and (name not in found or self.params['name_match'] == 'last'):
+                found[name] = (vm, props)
+        selected = []
+        missing = []
+        for name in self.params['names']:
+            if name in found:
+                selected.append(found[name])
+            else:
+                missing.append(dict(name=name, changed=False, failed=True, msg='Unable to find virtual machine'))
+        return selected, missing
+
+    def wait(self, task):
+        """ Poll a task until it completes, return its result """
+        deadline = time.time() + self.params['timeout']
+        while True:
+            info = task.info
+            if info.state == vim.TaskInfo.State.success:
+                return info.result
+            if info.state == vim.TaskInfo.State.error:
+                raise Exception(info.error.msg if info.error else 'An unknown error has occurred')
+            if time.time() > deadline:
+                raise Exception('Timed out after %d seconds' % self.params['timeout'])
+            time.sleep(1)
+
+    def configure(self, vm, props):
+        """ Reconfigure one vm when its boot options differ. Never raises, errors go into the result """
+        devices = props.get('config.hardware.device') or []
+        current = get_boot_options(props.get('config.bootOptions'), devices)
+        result = dict(name=props.get('name'), changed=False, failed=False, bootopts=current,
+                      hardware=build_hardware_map(devices))
+        try:
+            before, after, bootopts = compare_boot_options(current, self.params, devices)
+        except ValueError as ex:
+            result.update(failed=True, msg=to_native(ex))
+            return result
+        if bootopts is None:
+            return result
+
+        result.update(changed=True, diff=dict(before=before, after=after))
+        new = dict(current)
+        new.update(after)
+        result['bootopts'] = new
+        if self.module.check_mode:
+            return result
+        try:
+            self.wait(vm.ReconfigVM_Task(spec=vim.vm.ConfigSpec(bootOptions=bootopts)))
+        except vmodl.MethodFault as ex:
+            result.update(changed=False, failed=True, bootopts=current,
+                          msg="Failed to set boot options: %s" % to_native(ex.msg))
+        except Exception as ex:
+            result.update(changed=False, failed=True, bootopts=current,
+                          msg="Failed to set boot options: %s" % to_native(ex))
+        return result
+
+    def configure_many(self, vms):
+        """ Configure (vm, props) pairs from concurrency worker threads, keeping their order """
+        work = queue.Queue()
+        results = [None] * len(vms)
+        for index, item in enumerate(vms):
+            work.put((index, item))
+
+        def worker():
+            while True:
+                try:
+                    index, (vm, props) = work.get_nowait()
+                except queue.Empty:
+                    return
+                results[index] = self.configure(vm, props)
+
+        threads = [threading.Thread(target=worker) for i in range(min(self.params['concurrency'], len(vms)))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+
 def main():
     argument_spec = vmware_argument_spec()
     argument_spec.update(
@@ -123,37 +398,42 @@ def main():
         name_match=dict(type='str', choices=['first', 'last'], default='first'),
         uuid=dict(type='str'),
         folder=dict(type='str', default='/vm'),
+        datacenter=dict(type='str', default='ha-datacenter'),
+        names=dict(type='list'),
         bootdelay=dict(type='int'),
         bootorder=dict(type='list'),
         bootretrydelay=dict(type='int'),
         bootretry=dict(type='bool'),
         enterbios=dict(type='bool'),
+        concurrency=dict(type='int', default=10),
+        timeout=dict(type='int', default=120),
     )
 
     module = AnsibleModule(argument_spec=argument_spec,
-                           supports_check_mode=False,
+                           supports_check_mode=True,
                            mutually_exclusive=[
-                               ['name', 'uuid'],
+                               ['name', 'uuid', 'names'],
+                           ],
+                           required_one_of=[
+                               ['name', 'uuid', 'names'],
                            ],
                            )
 
+    if module.params['concurrency'] < 1:
+        module.fail_json(msg="concurrency must be at least 1")
 
-    pyv = PyVmomi(module)
-
-    # Check if the VM exists before continuing
-    vm = pyv.get_vm()
-    
-    if vm:
-        result = build_hardware_map(vm, vim)
-        #result = get_boot_options_vm(vm=vm)
-
-        #changed, configspec = compare_boot_options(vim, result, module.params)
-
+    pyv = BootOptHelper(module)
 
+    vms, missing = pyv.select_vms()
+    results = pyv.configure_many(vms) + missing
 
-        
-    else:
-        module.fail_json(msg="Unable to set boot options on non-existing virtual machine : '%s'" % (module.params.get('uuid') or module.params.get('name')))
+    result = dict(changed=any(r['changed'] for r in results), vms=results)
+    if not module.params['names'] and results:
+        # single virtual machine, keep its details at the top level
+        result['bootopts'] = results[0]['bootopts']
+        result['hardware'] = results[0]['hardware']
+    if any(r['failed'] for r in results):
+        module.fail_json(msg="Failed to set boot options on some virtual machines", **result)
 
     module.exit_json(**result)
 
@@ -17,7 +17,10 @@ DOCUMENTATION = r'''
 module: vmware_guest_screenshot
 short_description: Takes a screenshot of a virtual machine
 description:
-- Take a screenshot from a virtual machine
+- Take a screenshot of the console of one or more virtual machines with C(CreateScreenshot_Task).
+- The PNG file is written by vSphere next to the virtual machine files on its datastore,
+  and can optionally be downloaded to the machine running the module.
+- Several virtual machines, or every virtual machine in a folder, can be captured concurrently.
 version_added: '2.5'
 author:
 - Tim Rightnour (@garbled1) <thegarbledone@gmail.com>
@@ -29,6 +32,17 @@ options:
     description:
     - Name of the virtual machine to work with.
     - Virtual machine names in vCenter are not necessarily unique, which may be problematic, see C(name_match).
+  names:
+    description:
+    - List of names of virtual machines in C(folder) to capture.
+    - Mutually exclusive with C(name), C(uuid) and C(all_in_folder).
+    version_added: '2.5'
+  all_in_folder:
+    description:
+    - If C(yes), capture every powered on virtual machine in C(folder) and its subfolders.
+    default: 'no'
+    type: bool
+    version_added: '2.5'
   name_match:
     description:
     - If multiple virtual machines matching the name, use the first or last found.
@@ -41,7 +55,7 @@ options:
   folder:
     description:
     - Destination folder, absolute or relative path to find an existing guest.
-    - The folder should include the datacenter. ESX's datacenter is ha-datacenter
+    - A path that does not start with the datacenter is looked up under the C(vm) folder of C(datacenter).
     - 'Examples:'
     - '   folder: /ha-datacenter/vm'
     - '   folder: ha-datacenter/vm'
@@ -55,6 +69,35 @@ options:
     - '   folder: vm/folder2'
     - '   folder: folder2'
     default: /vm
+  datacenter:
+    description:
+    - Datacenter holding C(folder) when C(folder) does not include it. ESX's datacenter is ha-datacenter.
+    default: ha-datacenter
+    version_added: '2.5'
+  fetch:
+    description:
+    - If C(yes), stream each PNG file from the datastore into C(dest).
+    default: 'no'
+    type: bool
+    version_added: '2.5'
+  dest:
+    description:
+    - Local directory the PNG files are written to when C(fetch=yes).
+    - Files are written to a subdirectory of C(dest) named after the inventory path of the
+      virtual machine, datacenter and folders, so equally named virtual machines in
+      different folders do not overwrite each other. Within it, files are named after the
+      datastore file, which vSphere names after the virtual machine.
+    version_added: '2.5'
+  concurrency:
+    description:
+    - Number of virtual machines captured, and PNG files downloaded, at the same time.
+    default: 10
+    version_added: '2.5'
+  timeout:
+    description:
+    - Seconds to wait for each screenshot task to complete.
+    default: 120
+    version_added: '2.5'
 extends_documentation_fragment: vmware.documentation
 '''
 
@@ -69,37 +112,220 @@ EXAMPLES = r'''
     name: testvm_2
   delegate_to: localhost
   register: screenshot
+
+- name: Capture every console in a folder and download the PNG files
+  vmware_guest_screenshot:
+    hostname: 192.0.2.44
+    username: administrator@vsphere.local
+    password: vmware
+    validate_certs: no
+    folder: /datacenter1/vm/reimage
+    all_in_folder: yes
+    fetch: yes
+    dest: /srv/triage/screenshots
+    concurrency: 25
+  delegate_to: localhost
+  register: screenshots
+'''
+
+RETURN = r'''
+screenshot:
+    description: datastore path of the PNG file
+    returned: when a single virtual machine was given with name or uuid
+    type: string
+    sample: "[datastore1] testvm_2/testvm_2-1.png"
+screenshots:
+    description: per virtual machine results
+    returned: always
+    type: list
+    sample: [{"name": "testvm_2", "path": "[datastore1] testvm_2/testvm_2-1.png",
+              "dest": "/srv/triage/screenshots/DC0/vm/folder2/testvm_2-1.png", "failed": false}]
 '''
 
-RETURN = r''' # '''
+import errno
+import os
+import threading
+import time
+
+try:
+    from pyVmomi import vim, vmodl
+except ImportError:
+    pass
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.vmware import PyVmomi, vmware_argument_spec, wait_for_task, vim
-
-
-def screenshot_vm(vm):
-    task = None
-    try:
-        task= vm.CreateSnapshot()
-    except vim.fault.FileFault as ex:
-        self.module_fail_json(msg="Failed to take screenshot FileFault: %s" % to_native(ex.msg))
-    except vim.fault.InvalidPowerState:
-        self.module_fail_json(msg="Failed to take screenshot: Guest not powered on")
-    except vim.fault.InvalidState, vim.fault.RuntimeFault as ex:
-        self.module_fail_json(msg="Failed to take screenshot: %s" % to_native(ex.msg))
-    except vim.fault.TaskInProgress:
-        self.module.fail_json(msg="Failed to take screenshot: The guest is busy with another task")
-    except Exception as ex:
-        self.module.fail_json(msg="Failed to create screenshot due to %s" % to_native(ex.msg))
-
-    result = dict()
-    if task:
+from ansible.module_utils.six.moves import queue
+from ansible.module_utils.six.moves.urllib.parse import quote, urlencode
+from ansible.module_utils._text import to_native
+from ansible.module_utils.urls import open_url
+from ansible.module_utils.vmware import PyVmomi, vmware_argument_spec
+from ansible.module_utils.vmware_folder import find_vm_folder
+
+BUFSIZE = 1024 * 1024
+
+
+class ScreenshotHelper(PyVmomi):
+    def __init__(self, module):
+        super(ScreenshotHelper, self).__init__(module)
+        # reuse the API session to download from the datastore
+        self.cookie = self.content.sessionManager._stub.cookie.split(';')[0].strip()
+
+    def get_folder(self):
+        return find_vm_folder(self.module, self.content, self.params['folder'], self.params['datacenter'])
+
+    def folder_vms(self, folder, recurse):
+        """ Return (vm, name, powerState) of the virtual machines in folder, in a single retrieval """
+        view = self.content.viewManager.CreateContainerView(folder, [vim.VirtualMachine], recurse)
+        traversal = vmodl.query.PropertyCollector.TraversalSpec(name='traverseEntities', path='view',
+                                                                skip=False, type=vim.view.ContainerView)
+        obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal])
+        prop_spec = vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine,
+                                                               pathSet=['name', 'runtime.powerState'])
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=[obj_spec], propSet=[prop_spec])
+
+        pc = self.content.propertyCollector
+        vms = []
+        try:
+            result = pc.RetrievePropertiesEx([filter_spec], vmodl.query.PropertyCollector.RetrieveOptions())
+            while result:
+                for obj in result.objects:
+                    props = dict((prop.name, prop.val) for prop in obj.propSet)
+                    vms.append((obj.obj, props.get('name'), props.get('runtime.powerState')))
+                if not result.token:
+                    break
+                result = pc.ContinueRetrievePropertiesEx(result.token)
+        finally:
+            view.Destroy()
+        return vms
+
+    def select_vms(self):
+        """ Return the list of (vm, name) to capture, and results for the ones that cannot be """
+        skipped = []
+        if self.params['names']:
+            found = dict()
+            for vm, name, power_state in self.folder_vms(self.get_folder(), False):
+                if name in self.params['names'] and (name not in found or self.params['name_match'] == 'last'):
+                    found[name] = vm
+            selected = []
+            for name in self.params['names']:
+                if name in found:
+                    selected.append((found[name], name))
+                else:
+                    skipped.append(dict(name=name, failed=True, msg='Unable to find virtual machine'))
+            return selected, skipped
+
+        selected = []
+        for vm, name, power_state in self.folder_vms(self.get_folder(), True):
+            if power_state == vim.VirtualMachine.PowerState.poweredOn:
+                selected.append((vm, name))
+            else:
+                skipped.append(dict(name=name, failed=False, skipped=True, msg='Guest not powered on'))
+        return selected, skipped
+
+    def wait(self, task):
+        """ Poll a task until it completes, return its result """
+        deadline = time.time() + self.params['timeout']
+        while True:
+            info = task.info
+            if info.state == vim.TaskInfo.State.success:
+                return info.result
+            if info.state == vim.TaskInfo.State.error:
+                raise Exception(info.error.msg if info.error else 'An unknown error has occurred')
+            if time.time() > deadline:
+                raise Exception('Timed out after %d seconds' % self.params['timeout'])
+            time.sleep(1)
+
+    def screenshot_vm(self, vm):
+        """ Take a screenshot of vm, return the datastore path of the PNG file """
+        try:
+            task = vm.CreateScreenshot_Task()
+        except vim.fault.InvalidPowerState:
+            raise Exception("Guest not powered on")
+        except vim.fault.TaskInProgress:
+            raise Exception("The guest is busy with another task")
+        except vmodl.MethodFault as ex:
+            raise Exception(to_native(ex.msg))
+        return self.wait(task)
+
+    def datacenter_name(self, vm):
+        obj = vm.parent or vm.parentVApp
+        while obj is not None and not isinstance(obj, vim.Datacenter):
+            obj = obj.parent
+        return obj.name if obj is not None else 'ha-datacenter'
+
+    def inventory_dir(self, vm):
+        """ Local directory for the vm, the datacenter and folder names leading to it """
+        names = []
+        obj = vm.parent or vm.parentVApp
+        while obj is not None and not isinstance(obj, vim.Datacenter):
+            names.append(obj.name.replace(os.sep, '_'))
+            obj = obj.parent
+        names.append(obj.name.replace(os.sep, '_') if obj is not None else 'ha-datacenter')
+        return os.path.join(self.params['dest'], *reversed(names))
+
+    def fetch_png(self, vm, path):
+        """ Stream the PNG at datastore path into dest, return the local file name """
+        datastore, filename = path[1:].split('] ', 1)
+        url = 'https://%s/folder/%s?%s' % (self.params['hostname'], quote(filename),
+                                           urlencode(dict(dsName=datastore, dcPath=self.datacenter_name(vm))))
+        dest_dir = self.inventory_dir(vm)
         try:
-            tr, result = wait_for_task(task)
+            os.makedirs(dest_dir)
+        except OSError as ex:
+            # another worker may have created it
+            if ex.errno != errno.EEXIST:
+                raise
+        dest = os.path.join(dest_dir, os.path.basename(filename))
+        tmp = dest + '.part'
+        r = open_url(url, headers={'Cookie': self.cookie}, validate_certs=self.params['validate_certs'])
+        try:
+            with open(tmp, 'wb') as f:
+                while True:
+                    buf = r.read(BUFSIZE)
+                    if not buf:
+                        break
+                    f.write(buf)
+            os.rename(tmp, dest)
+        except Exception:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        finally:
+            r.close()
+        return dest
+
+    def capture(self, vm, name):
+        """ Screenshot, and optionally fetch, one vm. Never raises, errors go into the result """
+        result = dict(name=name, failed=False)
+        try:
+            result['path'] = self.screenshot_vm(vm)
+            if self.params['fetch']:
+                result['dest'] = self.fetch_png(vm, result['path'])
         except Exception as ex:
-            self.module.fail_json(msg="Failed to create screenshot due to %s" % to_native(ex.msg))
+            result.update(failed=True, msg="Failed to take screenshot: %s" % to_native(ex))
+        return result
+
+    def capture_many(self, vms):
+        """ Capture (vm, name) pairs from concurrency worker threads, keeping their order """
+        work = queue.Queue()
+        results = [None] * len(vms)
+        for index, item in enumerate(vms):
+            work.put((index, item))
+
+        def worker():
+            while True:
+                try:
+                    index, (vm, name) = work.get_nowait()
+                except queue.Empty:
+                    return
+                results[index] = self.capture(vm, name)
 
-    return result
+        threads = [threading.Thread(target=worker) for i in range(min(self.params['concurrency'], len(vms)))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        return results
 
 
 def main():
@@ -109,27 +335,56 @@ def main():
         name_match=dict(type='str', choices=['first', 'last'], default='first'),
         uuid=dict(type='str'),
         folder=dict(type='str', default='/vm'),
+        datacenter=dict(type='str', default='ha-datacenter'),
+        names=dict(type='list'),
+        all_in_folder=dict(type='bool', default=False),
+        fetch=dict(type='bool', default=False),
+        dest=dict(type='path'),
+        concurrency=dict(type='int', default=10),
+        timeout=dict(type='int', default=120),
     )
 
     module = AnsibleModule(argument_spec=argument_spec,
                            supports_check_mode=False,
                            mutually_exclusive=[
-                               ['name', 'uuid'],
+                               ['name', 'uuid', 'names', 'all_in_folder'],
+                           ],
+                           required_one_of=[
+                               ['name', 'uuid', 'names', 'all_in_folder'],
+                           ],
+                           required_if=[
+                               ['fetch', True, ['dest']],
                            ],
                            )
 
-    result = dict(changed=True,)
+    if module.params['concurrency'] < 1:
+        module.fail_json(msg="concurrency must be at least 1")
+    if module.params['fetch'] and not os.path.isdir(module.params['dest']):
+        module.fail_json(msg="dest %s must be an existing directory" % module.params['dest'])
 
-    pyv = PyVmomi(module)
+    result = dict(changed=True,)
 
-    # Check if the VM exists before continuing
-    vm = pyv.get_vm()
+    pyv = ScreenshotHelper(module)
 
-    if vm:
+    if module.params['name'] or module.params['uuid']:
+        # Check if the VM exists before continuing
+        vm = pyv.get_vm()
+        if not vm:
+            module.fail_json(msg="Unable to screenshot non-existing virtual machine : '%s'" % (module.params.get('uuid') or module.params.get('name')))
         # VM exists, take the shot
-        result['screenshot'] = screenshot_vm(vm)
-    else:
-        module.fail_json(msg="Unable to screenshot non-existing virtual machine : '%s'" % (module.params.get('uuid') or module.params.get('name')))
+        shot = pyv.capture(vm, vm.name)
+        result['screenshots'] = [shot]
+        if shot['failed']:
+            module.fail_json(msg=shot['msg'], **result)
+        result['screenshot'] = shot['path']
+        module.exit_json(**result)
+
+    vms, skipped = pyv.select_vms()
+    result['screenshots'] = pyv.capture_many(vms) + skipped
+    if not vms:
+        result['changed'] = False
+    if any(shot['failed'] for shot in result['screenshots']):
+        module.fail_json(msg="Failed to take some screenshots", **result)
 
     module.exit_json(**result)
 
@@ -43,6 +43,10 @@ options:
     description:
       - The file to push to vCenter
       - Required when C(state) is set to C(present)
+      - May also be a directory, or a list of files and directories. C(path) is then the remote
+        folder to upload into; the layout below a directory is recreated under it, missing folders
+        are created with C(FileManager.MakeDirectory), and files are uploaded in parallel over
+        keep-alive connections. This requires PyVmomi.
     required: false
   datacenter:
     description:
@@ -63,6 +67,85 @@ options:
     required: false
     default: 'yes'
     choices: ['yes', 'no']
+  transfer_via:
+    description:
+      - C(vcenter) sends the transfer to the C(/folder) endpoint of the vCenter server, which
+        relays every byte.
+      - C(host) logs in to the vSphere API, picks a connected ESXi host that mounts the
+        datastore, and sends the transfer straight to that host's C(/folder) endpoint using
+        a single use service ticket from C(SessionManager.AcquireGenericServiceTicket).
+      - C(host) requires PyVmomi.
+    default: vcenter
+    choices: ['vcenter', 'host']
+    version_added: '2.5'
+  force:
+    description:
+      - If C(no), a C(HEAD) request is made first and the upload is skipped with
+        C(changed=false) when the remote file is unchanged.
+      - Without C(digest_sidecar), the remote file is unchanged when it has the same size
+        as C(src) and its C(Last-Modified) time is not older than the mtime of C(src).
+      - If C(yes), the file is always uploaded.
+    default: 'no'
+    type: bool
+    version_added: '2.5'
+  digest_sidecar:
+    description:
+      - If C(yes), a C(<path>.sha1) file holding the sha1 digest of the upload is written
+        next to the remote file, and is compared with the digest of C(src) when the sizes match.
+      - The digest of C(src) is kept in C(checksum_cache), keyed by path, size and mtime,
+        so unchanged large files are not hashed on every run.
+    default: 'no'
+    type: bool
+    version_added: '2.5'
+  checksum_cache:
+    description:
+      - Local file caching the sha1 digests of uploaded files for C(digest_sidecar).
+    default: ~/.ansible/tmp/vsphere_copy_checksums.json
+    version_added: '2.5'
+  concurrency:
+    description:
+      - Number of files uploaded in parallel when C(src) is a directory or a list.
+    default: 1
+    version_added: '2.5'
+  chunk_size:
+    description:
+      - Size in bytes of the slices the file is streamed in. The file is mapped into memory
+        and only one slice at a time is copied, so memory use stays bounded for any file size.
+    default: 1048576
+    version_added: '2.5'
+  retries:
+    description:
+      - Number of times an upload is retried after a dropped connection or a server error.
+      - Retries wait C(retry_delay) seconds, doubling after every attempt.
+    default: 3
+    version_added: '2.5'
+  retry_delay:
+    description:
+      - Seconds to wait before the first retry.
+    default: 5
+    version_added: '2.5'
+  resume:
+    description:
+      - If C(yes) and C(transfer_via=host), a retry after an attempt of this run was interrupted
+        continues at the size the ESXi host already has, using a C(Content-Range) ranged write.
+        When the host refuses the ranged write, the whole file is sent again.
+      - The first attempt always sends the whole file, so an older, shorter remote file is
+        replaced rather than appended to.
+    default: 'no'
+    type: bool
+    version_added: '2.5'
+  max_bandwidth:
+    description:
+      - Limit in bytes per second on the combined rate of all uploads of the task,
+        shared by the C(concurrency) streams.
+      - Unlimited when not set.
+    version_added: '2.5'
+  timeout:
+    description:
+      - Seconds to wait for the datastore to connect, accept or answer a request before the
+        attempt fails and is retried.
+    default: 10
+    version_added: '2.5'
 
 notes:
   - "This module ought to be run from a system that can access vCenter directly and has the file to transfer.
@@ -100,19 +183,140 @@ EXAMPLES = '''
     datacenter: DC2 Someplace
     datastore: datastore2
     path: other/remote/file
+- name: Copy an ISO straight to an ESXi host that mounts the datastore
+  vsphere_copy:
+    host: vhost
+    login: vuser
+    password: vpass
+    src: /isos/install.iso
+    datacenter: DC1 Someplace
+    datastore: datastore1
+    path: isos/install.iso
+    transfer_via: host
+  transport: local
+- name: Distribute an ISO, skipping the upload when the datastore copy is identical
+  vsphere_copy:
+    host: vhost
+    login: vuser
+    password: vpass
+    src: /isos/install.iso
+    datacenter: DC1 Someplace
+    datastore: datastore1
+    path: isos/install.iso
+    digest_sidecar: yes
+  transport: local
+- name: Upload a large disk straight to ESXi, resuming where a dropped upload stopped
+  vsphere_copy:
+    host: vhost
+    login: vuser
+    password: vpass
+    src: /srv/disks/data-flat.vmdk
+    datacenter: DC1 Someplace
+    datastore: datastore1
+    path: data/data-flat.vmdk
+    transfer_via: host
+    resume: yes
+    retries: 5
+  transport: local
+- name: Upload a template directory, 8 files at a time
+  vsphere_copy:
+    host: vhost
+    login: vuser
+    password: vpass
+    src: /srv/templates/rhel7/
+    datacenter: DC1 Someplace
+    datastore: datastore1
+    path: templates/rhel7
+    concurrency: 8
+  transport: local
+- name: Upload templates during business hours, capped at 50 MB/s over all streams
+  vsphere_copy:
+    host: vhost
+    login: vuser
+    password: vpass
+    src: /srv/templates/rhel7/
+    datacenter: DC1 Someplace
+    datastore: datastore1
+    path: templates/rhel7
+    concurrency: 4
+    max_bandwidth: 52428800
+  transport: local
+'''
+
+RETURN = '''
+files:
+    description: per file results when src is a directory or a list
+    returned: when src is a directory or a list
+    type: list
+    sample: [{"src": "/srv/templates/rhel7/rhel7.vmdk", "dest": "templates/rhel7/rhel7.vmdk",
+              "changed": true, "status": 201, "size": 1073741824}]
+bytes:
+    description: number of bytes sent, over all files and attempts
+    returned: when state is present
+    type: int
+    sample: 42949672960
+elapsed:
+    description: seconds from the first transfer request to the last byte moved
+    returned: when state is present
+    type: float
+    sample: 312.5
+throughput:
+    description: average upload rate in bytes per second
+    returned: when state is present
+    type: int
+    sample: 137438953
+peak_throughput:
+    description: highest upload rate in bytes per second over any one second window
+    returned: when state is present
+    type: int
+    sample: 201326592
+ttfb:
+    description: seconds from the first transfer request to the first byte of file data sent, null if none was
+    returned: when state is present
+    type: float
+    sample: 0.214
+attempts:
+    description: number of PUT requests made for the upload
+    returned: when a file was uploaded
+    type: int
+    sample: 2
+resumed_from:
+    description: offset the last attempt resumed the upload at, 0 for a full upload
+    returned: when a file was uploaded
+    type: int
+    sample: 40802189312
+bytes_sent:
+    description: bytes sent over all attempts
+    returned: when a file was uploaded
+    type: int
+    sample: 45097156608
 '''
 
 import os
-import atexit
+import base64
 import errno
+import json
 import mmap
+import posixpath
 import socket
+import threading
+import time
 import traceback
+from email.utils import parsedate_tz, mktime_tz
+
+try:
+    from pyVmomi import vim
+except ImportError:
+    pass
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.six.moves import http_client, queue
 from ansible.module_utils.six.moves.urllib.parse import urlencode
-from ansible.module_utils._text import to_native
-from ansible.module_utils.urls import open_url
+from ansible.module_utils._text import to_bytes, to_native
+from ansible.module_utils.vsphere_transfer import (BUFSIZE, DatastoreSession, Throttle, connect_vsphere,
+                                                   find_datastore, find_datastore_host)
+
+CACHE_LOCK = threading.Lock()
 
 
 def vmware_path(datastore, datacenter, path):
@@ -130,6 +334,317 @@ def vmware_path(datastore, datacenter, path):
     return "%s?%s" % (path, params)
 
 
+def host_ticket(content, url, method):
+    """ Return the cookie header of a single use service ticket for one request to an ESXi host """
+    spec = vim.SessionManager.HttpServiceRequestSpec(method=method, url=url)
+    ticket = content.sessionManager.AcquireGenericServiceTicket(spec)
+    return {'Cookie': 'vmware_cgi_ticket=%s' % ticket.id}
+
+
+class Uploader(object):
+    """ Upload, compare and delete datastore files over DatastoreSessions """
+    def __init__(self, module, host, datacenter, datastore, si=None, content=None, ticketed=False, throttle=None):
+        self.module = module
+        self.throttle = throttle
+        self.params = module.params
+        self.host = host
+        self.datacenter = datacenter
+        self.datastore = datastore
+        self.content = content
+        self.ticketed = ticketed
+        if si is not None:
+            # reuse the API login instead of authenticating every request
+            self.auth = {'Cookie': si._stub.cookie.split(';')[0].strip()}
+        else:
+            credentials = '%s:%s' % (self.params['login'], self.params['password'])
+            self.auth = {'Authorization': 'Basic %s' % to_native(base64.b64encode(to_bytes(credentials)))}
+
+    def session(self):
+        return DatastoreSession(self.host, self.params['validate_certs'], timeout=self.params['timeout'],
+                                chunk_size=self.params['chunk_size'], throttle=self.throttle)
+
+    def url(self, path):
+        return 'https://%s%s' % (self.host, vmware_path(self.datastore, self.datacenter, path))
+
+    def request(self, session, method, path, data=None, headers=None, offset=0):
+        all_headers = dict(headers or {})
+        if self.ticketed:
+            all_headers.update(host_ticket(self.content, self.url(path), 'http%s' % method.capitalize()))
+        else:
+            all_headers.update(self.auth)
+        return session.request(method, vmware_path(self.datastore, self.datacenter, path), all_headers, data,
+                               offset=offset)
+
+    def stat(self, session, path):
+        """ HEAD a remote file, return dict(size, mtime) or None when it does not exist """
+        status, reason, headers, body = self.request(session, 'HEAD', path)
+        if status == 404:
+            return None
+        if not 200 <= status < 300:
+            raise Exception("HEAD %s failed: %s %s" % (path, status, reason))
+        size = headers.get('content-length')
+        mtime = None
+        if headers.get('last-modified'):
+            parsed = parsedate_tz(headers['last-modified'])
+            if parsed:
+                mtime = mktime_tz(parsed)
+        return dict(size=int(size) if size is not None else None, mtime=mtime)
+
+    def remote_digest(self, session, path):
+        """ Read the digest sidecar of path, return the digest or None """
+        status, reason, headers, body = self.request(session, 'GET', path + '.sha1')
+        if status != 200:
+            return None
+        fields = body.split()
+        return to_native(fields[0]).lower() if fields else None
+
+    def unchanged(self, session, src, path):
+        """
+        Compare src with the remote file, return (unchanged, sha1 of src or None).
+        Sizes must match, then the sidecar digest decides when there is one,
+        and otherwise the remote file must not be older than src.
+        """
+        st = os.stat(src)
+        remote = self.stat(session, path)
+        if remote is None or remote['size'] != st.st_size:
+            return False, None
+        digest = None
+        if self.params['digest_sidecar']:
+            digest = local_digest(self.module, src, self.params['checksum_cache'])
+            remote_sum = self.remote_digest(session, path)
+            if remote_sum is not None:
+                return remote_sum == digest, digest
+        return remote['mtime'] is not None and remote['mtime'] >= st.st_mtime, digest
+
+    def upload(self, session, src, path):
+        """ Upload src to path unless the remote file is unchanged, return a result dict """
+        result = dict(src=src, dest=path, url=self.url(path), changed=False)
+        digest = None
+        if not self.params['force']:
+            unchanged, digest = self.unchanged(session, src, path)
+            if unchanged:
+                result.update(msg='remote file is unchanged', checksum=digest)
+                return result
+        result['changed'] = True
+        if self.module.check_mode:
+            return result
+
+        size = os.stat(src).st_size
+        f = open(src, 'rb')
+        try:
+            data = b''
+            if size:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                status, reason = self.put(session, path, data, result)
+            finally:
+                if size:
+                    data.close()
+        finally:
+            f.close()
+        result.update(status=status, reason=reason, size=size)
+        if not 200 <= status < 300:
+            result.update(failed=True, msg='Failed to upload', changed=False)
+            return result
+
+        if self.params['digest_sidecar']:
+            if digest is None:
+                digest = local_digest(self.module, src, self.params['checksum_cache'])
+            sidecar = ('%s  %s\n' % (digest, posixpath.basename(path))).encode('utf-8')
+            status, reason, headers, body = self.request(session, 'PUT', path + '.sha1', sidecar,
+                                                         {"Content-Type": "application/octet-stream"})
+            if not 200 <= status < 300:
+                result.update(failed=True, msg='Uploaded the file but failed to write the digest sidecar')
+        result['checksum'] = digest
+        return result
+
+    def resume_offset(self, session, path, size):
+        """
+        Return the offset to resume an interrupted upload of size bytes at.
+        Only a direct ESXi endpoint accepts ranged writes, and only a remote
+        file shorter than the upload is taken as a partial copy of it.
+        """
+        if not (self.params['resume'] and self.ticketed):
+            return 0
+        try:
+            remote = self.stat(session, path)
+        except Exception:
+            return 0
+        if remote is None or not remote['size'] or remote['size'] >= size:
+            return 0
+        return remote['size']
+
+    def put(self, session, path, data, result):
+        """
+        PUT data to path, retrying dropped connections and server errors
+        with exponential backoff. With resume, a retry continues from the
+        size the server already has with a Content-Range header, and falls
+        back to a full upload when the ranged write is refused. Records
+        attempts, resumed_from and bytes_sent in result.
+        """
+        size = len(data)
+        ranged = True
+        result.update(attempts=0, resumed_from=0, bytes_sent=0)
+        for attempt in range(self.params['retries'] + 1):
+            if attempt:
+                time.sleep(self.params['retry_delay'] * 2 ** (attempt - 1))
+            result['attempts'] += 1
+            headers = {"Content-Type": "application/octet-stream"}
+            offset = 0
+            # only the partial copy a failed attempt of this run left behind is resumed
+            if attempt and ranged:
+                offset = self.resume_offset(session, path, size)
+            result['resumed_from'] = offset
+            if offset:
+                headers['Content-Range'] = 'bytes %d-%d/%d' % (offset, size - 1, size)
+            start = session.sent
+            try:
+                status, reason, resp_headers, body = self.request(session, 'PUT', path, data, headers, offset)
+                if offset and status in (400, 405, 416, 501):
+                    # no ranged writes here, send the whole file
+                    ranged = False
+                    result['resumed_from'] = 0
+                    status, reason, resp_headers, body = self.request(session, 'PUT', path, data,
+                                                                      {"Content-Type": "application/octet-stream"})
+            except (socket.error, http_client.HTTPException):
+                result['bytes_sent'] += session.sent - start
+                if attempt == self.params['retries']:
+                    raise
+                continue
+            result['bytes_sent'] += session.sent - start
+            if status < 500 or attempt == self.params['retries']:
+                return status, reason
+        return status, reason
+
+    def delete(self, session, path):
+        """ Delete path, and its digest sidecar, return a result dict """
+        result = dict(dest=path, url=self.url(path), changed=False)
+        if self.module.check_mode:
+            result['changed'] = self.stat(session, path) is not None
+            return result
+        status, reason, headers, body = self.request(session, 'DELETE', path)
+        result.update(status=status, reason=reason)
+        # it's legal to return 404 on delete of non-existent object
+        if status == 204 or status == 404:
+            return result
+        if not 200 <= status < 300:
+            result.update(failed=True, msg='Failed to delete')
+            return result
+        result['changed'] = True
+        if self.params['digest_sidecar']:
+            self.request(session, 'DELETE', path + '.sha1')
+        return result
+
+
+def local_digest(module, src, cache_path):
+    """ Return the sha1 of src, reusing the cached value while its size and mtime are unchanged """
+    st = os.stat(src)
+    key = os.path.abspath(src)
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        cache = dict()
+    entry = cache.get(key)
+    if entry and entry.get('size') == st.st_size and entry.get('mtime') == st.st_mtime:
+        return entry['sha1']
+
+    digest = module.sha1(src)
+    with CACHE_LOCK:
+        try:
+            with open(cache_path) as f:
+                cache = json.load(f)
+        except (IOError, OSError, ValueError):
+            cache = dict()
+        cache[key] = dict(size=st.st_size, mtime=st.st_mtime, sha1=digest)
+        try:
+            cache_dir = os.path.dirname(cache_path)
+            if cache_dir and not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            tmp = '%s.%d.tmp' % (cache_path, os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(cache, f)
+            os.rename(tmp, cache_path)
+        except (IOError, OSError):
+            # the cache only saves time, a failure to write it is not fatal
+            pass
+    return digest
+
+
+def expand_src(module, src, dest):
+    """
+    Expand a list of files and directories into (local file, remote path)
+    pairs. The layout below a directory is recreated below dest, files
+    are put into dest by their basename.
+    """
+    pairs = []
+    for item in src:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    local = os.path.join(root, name)
+                    rel = os.path.relpath(local, item).replace(os.sep, '/')
+                    pairs.append((local, posixpath.join(dest, rel)))
+        elif os.path.isfile(item):
+            pairs.append((item, posixpath.join(dest, os.path.basename(item))))
+        else:
+            module.fail_json(msg="Source %s does not exist" % item)
+    return pairs
+
+
+def make_directories(module, content, datacenter, datastore, paths):
+    """ Create the remote folders holding paths with FileManager.MakeDirectory """
+    dc = content.searchIndex.FindByInventoryPath(datacenter)
+    if not isinstance(dc, vim.Datacenter):
+        module.fail_json(msg='Failed to find datacenter "%s"' % datacenter)
+    for folder in sorted(set(posixpath.dirname(path.strip('/')) for path in paths)):
+        if not folder:
+            continue
+        try:
+            content.fileManager.MakeDirectory(name='[%s] %s' % (datastore, folder), datacenter=dc,
+                                              createParentDirectories=True)
+        except vim.fault.FileAlreadyExists:
+            pass
+        except Exception as e:
+            module.fail_json(msg='Failed to create folder %s: %s' % (folder, to_native(e)))
+
+
+def upload_many(uploader, pairs, concurrency):
+    """ Upload (local, remote) pairs from worker threads, each owning a keep-alive session """
+    work = queue.Queue()
+    results = []
+    for src, path in pairs:
+        result = dict(src=src, dest=path, changed=False, failed=True, msg='not uploaded')
+        results.append(result)
+        work.put(result)
+
+    def worker():
+        session = uploader.session()
+        try:
+            while True:
+                try:
+                    result = work.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    outcome = uploader.upload(session, result['src'], result['dest'])
+                    del result['failed'], result['msg']
+                    result.update(outcome)
+                except Exception as e:
+                    result['msg'] = to_native(e)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=worker) for i in range(min(concurrency, len(pairs)))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
 def main():
 
     module = AnsibleModule(
@@ -138,98 +653,110 @@ def main():
             host=dict(required=True, aliases=['hostname']),
             login=dict(required=True, aliases=['username']),
             password=dict(required=True, no_log=True),
-            src=dict(required=False, aliases=['name']),
+            src=dict(required=False, aliases=['name'], type='raw'),
             datacenter=dict(required=True),
             datastore=dict(required=True),
             dest=dict(required=True, aliases=['path']),
             validate_certs=dict(required=False, default=True, type='bool'),
+            transfer_via=dict(required=False, default='vcenter', choices=['vcenter', 'host']),
+            force=dict(required=False, default=False, type='bool'),
+            digest_sidecar=dict(required=False, default=False, type='bool'),
+            checksum_cache=dict(required=False, default='~/.ansible/tmp/vsphere_copy_checksums.json', type='path'),
+            concurrency=dict(required=False, default=1, type='int'),
+            chunk_size=dict(required=False, default=BUFSIZE, type='int'),
+            retries=dict(required=False, default=3, type='int'),
+            retry_delay=dict(required=False, default=5, type='int'),
+            resume=dict(required=False, default=False, type='bool'),
+            max_bandwidth=dict(required=False, type='int'),
+            timeout=dict(required=False, default=10, type='int'),
         ),
-        # Implementing check-mode using HEAD is impossible, since size/date is not 100% reliable
-        supports_check_mode = False,
+        supports_check_mode = True,
         required_if=[
             [ 'state', 'present', [ 'src' ] ]
             ],
     )
 
     host = module.params.get('host')
-    login = module.params.get('login')
-    password = module.params.get('password')
     src = module.params.get('src')
     datacenter = module.params.get('datacenter')
     datastore = module.params.get('datastore')
     dest = module.params.get('dest')
-    validate_certs = module.params.get('validate_certs')
     state = module.params.get('state')
+    transfer_via = module.params.get('transfer_via')
+    concurrency = module.params.get('concurrency')
 
+    if concurrency < 1:
+        module.fail_json(msg="concurrency must be at least 1")
+    if module.params['chunk_size'] < 1:
+        module.fail_json(msg="chunk_size must be at least 1")
+    if module.params['retries'] < 0:
+        module.fail_json(msg="retries must not be negative")
+    if module.params['max_bandwidth'] is not None and module.params['max_bandwidth'] < 1:
+        module.fail_json(msg="max_bandwidth must be at least 1")
+
+    multi = False
     if state == 'present':
-        fd = open(src, "rb")
-        atexit.register(fd.close)
+        if isinstance(src, list):
+            multi = True
+        elif os.path.isdir(src):
+            multi = True
+            src = [src]
+        elif not os.path.isfile(src):
+            module.fail_json(msg="Source %s does not exist" % src)
 
-        if os.stat(src).st_size == 0:
-            data = ''
-        else:
-            data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
-            atexit.register(data.close)
+    si = content = None
+    dc_path = datacenter
+    if transfer_via == 'host' or multi:
+        si, content = connect_vsphere(module, module.params['login'], module.params['password'])
+    if transfer_via == 'host':
+        host = find_datastore_host(module, find_datastore(module, content, datacenter, datastore)).name
+        # an ESXi host only knows its own datacenter
+        dc_path = 'ha-datacenter'
+    throttle = Throttle(module.params['max_bandwidth'])
+    uploader = Uploader(module, host, dc_path, datastore, si=si, content=content,
+                        ticketed=(transfer_via == 'host'), throttle=throttle)
+
+    if multi:
+        pairs = expand_src(module, src, dest)
+        if not module.check_mode:
+            make_directories(module, content, datacenter, datastore, [path for local, path in pairs])
+        results = upload_many(uploader, pairs, concurrency)
+        res_args = dict(changed=any(result['changed'] for result in results), files=results)
+        res_args.update(throttle.stats())
+        if any(result.get('failed') for result in results):
+            module.fail_json(msg='Failed to upload some files', **res_args)
+        module.exit_json(**res_args)
+
+    if state == 'present':
         action = 'upload'
     elif state == 'absent':
         action = 'delete'
-        data = ''
-
-    remote_path = vmware_path(datastore, datacenter, dest)
-    url = 'https://%s%s' % (host, remote_path)
-
-    headers = {
-        "Content-Type": "application/octet-stream",
-        "Content-Length": str(len(data)),
-    }
 
+    session = uploader.session()
     try:
         if state == 'present':
-            r = open_url(url, data=data, headers=headers, method='PUT',
-                         url_username=login, url_password=password,
-                         validate_certs=validate_certs, force_basic_auth=True)
+            result = uploader.upload(session, src, dest)
         elif state == 'absent':
-            r = open_url(url, headers=headers, method='DELETE',
-                         url_username=login, url_password=password,
-                         validate_certs=validate_certs, force_basic_auth=True)
-
+            result = uploader.delete(session, dest)
     except socket.error as e:
-        if isinstance(e.args, tuple) and e[0] == errno.ECONNRESET:
+        if e.errno == errno.ECONNRESET:
             # VSphere resets connection if the file is in use and cannot be replaced
-            module.fail_json(msg='Failed to {0}, image probably in use'.format(action), status=None, errno=e[0], reason=to_native(e), url=url)
+            module.fail_json(msg='Failed to {0}, image probably in use'.format(action), status=None, errno=e.errno,
+                             reason=to_native(e), url=uploader.url(dest))
         else:
-            module.fail_json(msg=str(e), status=None, errno=e[0], reason=str(e),
-                             url=url, exception=traceback.format_exc())
+            module.fail_json(msg=to_native(e), status=None, errno=e.errno, reason=to_native(e),
+                             url=uploader.url(dest), exception=traceback.format_exc())
     except Exception as e:
-        error_code = -1
-        try:
-            if isinstance(e[0], int):
-                error_code = e[0]
-        except KeyError:
-            pass
-        module.fail_json(msg=to_native(e), status=None, errno=error_code,
-                         reason=to_native(e), url=url, exception=traceback.format_exc())
-
-    status = r.getcode()
+        module.fail_json(msg=to_native(e), status=None, errno=-1,
+                         reason=to_native(e), url=uploader.url(dest), exception=traceback.format_exc())
+    finally:
+        session.close()
 
-    # it's legal to return 404 on delete of non-existent object
-    if state == 'absent':
-        if status == 204 or status == 404:
-            module.exit_json(changed=False, status=status, reason=r.msg, url=url)
-        if 200 <= status < 300:
-            module.exit_json(changed=True, status=status, reason=r.msg, url=url)
-    elif state == 'present':
-        if 200 <= status < 300:
-            module.exit_json(changed=True, status=status, reason=r.msg, url=url)
-        else:
-            length = r.headers.get('content-length', None)
-            if r.headers.get('transfer-encoding', '').lower() == 'chunked':
-                chunked = 1
-            else:
-                chunked = 0
-
-    module.fail_json(msg='Failed to {0}'.format(action), errno=None, status=status, reason=r.msg,
-                     length=length, headers=dict(r.headers), chunked=chunked, url=url)
+    if state == 'present':
+        result.update(throttle.stats())
+    if result.pop('failed', False):
+        module.fail_json(**result)
+    module.exit_json(**result)
 
 
 if __name__ == '__main__':
@@ -41,6 +41,18 @@ options:
   src:
     description:
       - The file on the datastore to fetch
+      - If C(src) ends with a C(/) it is taken as a directory and every file below it is fetched.
+      - If C(src) contains shell style wildcards (C(*), C(?) or C([])), it is expanded with the
+        datastore browser and every matching file is fetched. Wildcards do not match C(/), so
+        C(*/vmware*.log) matches the logs in every top level folder.
+      - In directory and glob mode, C(dest) must be a directory, the layout below the
+        non-wildcard part of C(src) is recreated under it, and the files are downloaded
+        over keep-alive HTTPS connections reusing the C(vmware_soap_session) of a single login.
+        C(checksum), C(manifest), C(resume) and C(backup) only apply to a single file and
+        fail the task when combined with directory or glob mode.
+      - C([) always starts a wildcard, so a name containing a literal C([) is written with
+        C([[]), for example C(vm[[]1]/vm[[]1].vmx) for C(vm[1]/vm[1].vmx), and is fetched in
+        glob mode.
     required: true
   datacenter:
     description:
@@ -87,6 +99,91 @@ options:
     description:
       - Timeout in seconds for URL request.
     default: 10
+  concurrency:
+    description:
+      - Number of byte ranges of the file to download in parallel.
+      - In directory and glob mode, the number of files downloaded in parallel instead.
+      - When greater than 1, the file is requested in C(chunk_size) ranges which are
+        written into a preallocated temporary file as they arrive.
+      - If the server ignores the C(Range) header, the module falls back to a single stream.
+    default: 1
+    version_added: '2.5'
+  chunk_size:
+    description:
+      - Size in bytes of each byte range requested when C(concurrency) is greater than 1.
+      - Files smaller than this are always fetched in a single request.
+    default: 67108864
+    version_added: '2.5'
+  checksum:
+    description:
+      - 'If a checksum is passed to this parameter, the digest of the destination file
+        will be calculated after it is downloaded to ensure its integrity and verify
+        that the transfer completed successfully. Format: <algorithm>:<checksum>,
+        e.g. checksum="sha256:D98291AC[...]B6DC7B97"'
+      - If the destination file already exists and matches the checksum, the
+        module returns without downloading anything, even with C(force=yes).
+      - Digests are computed while the data streams in, so the file is not read
+        back from disk after the download.
+    default: ''
+    version_added: '2.5'
+  transfer_via:
+    description:
+      - C(vcenter) downloads through the C(/folder) endpoint of the vCenter server, which
+        relays every byte.
+      - C(host) logs in to the vSphere API, picks a connected ESXi host that mounts the
+        datastore, and downloads straight from that host's C(/folder) endpoint using a
+        single use service ticket from C(SessionManager.AcquireGenericServiceTicket)
+        for every request.
+    default: vcenter
+    choices: ['vcenter', 'host']
+    version_added: '2.5'
+  sparse:
+    description:
+      - If C(yes), blocks of zeros are detected while the data streams in and are
+        skipped with a seek instead of being written, so thin or mostly empty disk
+        files become sparse local files with the same content and checksum.
+      - When C(tmp_dest) is not set, the temporary file is created next to C(dest),
+        so the final move is a rename that keeps the holes.
+    default: 'no'
+    type: bool
+    version_added: '2.5'
+  manifest:
+    description:
+      - If C(yes), record the remote C(Last-Modified), C(ETag), size and sha1 digest of
+        every fetched file in a hidden sidecar file next to C(dest).
+      - With C(force=yes), a conditional C(HEAD) request is made against the recorded
+        values first, and the download is skipped with C(changed=false) when the
+        remote file has not changed.
+    default: 'no'
+    type: bool
+    version_added: '2.5'
+  resume:
+    description:
+      - If C(yes), the download is kept in a partial file at a stable path under C(tmp_dest)
+        and a failed transfer is continued from the partial length with a C(Range) request,
+        instead of being restarted at byte zero.
+      - The remote size and C(Last-Modified) are recorded next to the partial file, and the
+        download starts over when the remote file has changed.
+      - Resumed downloads use a single stream, C(concurrency) is ignored.
+    default: 'no'
+    type: bool
+    version_added: '2.5'
+  retries:
+    description:
+      - Number of times a failed transfer is retried within the module when C(resume=yes).
+    default: 3
+    version_added: '2.5'
+  retry_delay:
+    description:
+      - Seconds to wait before the first retry, doubled after every failed attempt.
+    default: 5
+    version_added: '2.5'
+  max_bandwidth:
+    description:
+      - Limit in bytes per second on the combined rate of all downloads of the task,
+        shared by the C(concurrency) streams.
+      - Unlimited when not set.
+    version_added: '2.5'
   others:
     description:
       - all arguments accepted by the M(file) module also work here
@@ -123,6 +220,88 @@ EXAMPLES = '''
     group: root
     mode: 0644
   delegate_to: other_system
+- name: Fetch a large disk file using 8 parallel 256MB byte ranges
+  vsphere_fetch:
+    host: vhost
+    login: vuser
+    password: vpass
+    src: bigvm/bigvm-flat.vmdk
+    datacenter: DC1 Someplace
+    datastore: datastore1
+    dest: /backup/bigvm-flat.vmdk
+    concurrency: 8
+    chunk_size: 268435456
+  transport: local
+- name: Fetch a large file over a flaky link, resuming where a previous run stopped
+  vsphere_fetch:
+    host: vhost
+    login: vuser
+    password: vpass
+    src: bigvm/bigvm-flat.vmdk
+    datacenter: DC1 Someplace
+    datastore: datastore1
+    dest: /backup/bigvm-flat.vmdk
+    tmp_dest: /backup/partial
+    resume: yes
+    retries: 10
+  transport: local
+- name: Refresh a file only when it changed on the datastore
+  vsphere_fetch:
+    host: vhost
+    login: vuser
+    password: vpass
+    src: isos/install.iso
+    datacenter: DC1 Someplace
+    datastore: datastore1
+    dest: /srv/isos/install.iso
+    force: yes
+    manifest: yes
+  transport: local
+- name: Fetch a thin provisioned disk as a sparse file
+  vsphere_fetch:
+    host: vhost
+    login: vuser
+    password: vpass
+    src: thinvm/thinvm-flat.vmdk
+    datacenter: DC1 Someplace
+    datastore: datastore1
+    dest: /backup/thinvm-flat.vmdk
+    sparse: yes
+  transport: local
+- name: Fetch a file directly from an ESXi host mounting the datastore
+  vsphere_fetch:
+    host: vhost
+    login: vuser
+    password: vpass
+    src: isos/install.iso
+    datacenter: DC1 Someplace
+    datastore: datastore1
+    dest: /srv/isos/install.iso
+    transfer_via: host
+  transport: local
+- name: Collect the vmware.log of every virtual machine, 8 at a time
+  vsphere_fetch:
+    host: vhost
+    login: vuser
+    password: vpass
+    src: '*/vmware.log'
+    datacenter: DC1 Someplace
+    datastore: datastore1
+    dest: /srv/vmlogs/
+    concurrency: 8
+  transport: local
+- name: Fetch a disk during business hours without saturating the management network
+  vsphere_fetch:
+    host: vhost
+    login: vuser
+    password: vpass
+    src: vm1/vm1-flat.vmdk
+    datacenter: DC1 Someplace
+    datastore: datastore1
+    dest: /srv/backup/vm1-flat.vmdk
+    concurrency: 4
+    max_bandwidth: 52428800
+  transport: local
 '''
 
 RETURN = r'''
@@ -151,6 +330,16 @@ md5sum:
     returned: when supported
     type: string
     sample: "2a5aeecc61dc98c4d780b14b330e3282"
+checksum_src:
+    description: sha1 checksum of the downloaded file
+    returned: success
+    type: string
+    sample: 6e642bb8dd5c2e027bf21dd923337cbb4214f827
+checksum_dest:
+    description: sha1 checksum of the file after the download
+    returned: success
+    type: string
+    sample: 6e642bb8dd5c2e027bf21dd923337cbb4214f827
 mode:
     description: permissions of the target
     returned: success
@@ -201,6 +390,11 @@ url:
     returned: always
     type: string
     sample: https://www.ansible.com/
+transfer_host:
+    description: the ESXi host the file was downloaded from
+    returned: when transfer_via=host
+    type: string
+    sample: esx01.example.com
 datastore:
     description: the datastore we fetched the file from
     returned: success
@@ -211,20 +405,89 @@ datacenter:
     returned: success
     type: string
     sample: dc_1
+segments:
+    description: number of byte ranges the file was downloaded in
+    returned: success
+    type: int
+    sample: 4
+resumed_from:
+    description: offset in bytes a resumed download continued from
+    returned: when resume=yes
+    type: int
+    sample: 1073741824
+files:
+    description: per file results in directory and glob mode
+    returned: when src is a directory or a glob
+    type: list
+    sample: [{"src": "vm1/vmware.log", "dest": "/srv/vmlogs/vm1/vmware.log", "size": 204800,
+              "changed": true, "checksum": "6e642bb8dd5c2e027bf21dd923337cbb4214f827", "status": 200}]
+sparse_skipped:
+    description: number of zero bytes that were skipped instead of written
+    returned: when sparse=yes
+    type: int
+    sample: 515396075520
+attempts:
+    description: number of transfer attempts needed to complete a resumable download
+    returned: when resume=yes
+    type: int
+    sample: 2
+bytes:
+    description: number of bytes received, over all files, ranges and attempts
+    returned: when data was transferred
+    type: int
+    sample: 42949672960
+elapsed:
+    description: seconds from the first transfer request to the last byte moved
+    returned: when data was transferred
+    type: float
+    sample: 312.5
+throughput:
+    description: average download rate in bytes per second
+    returned: when data was transferred
+    type: int
+    sample: 137438953
+peak_throughput:
+    description: highest download rate in bytes per second over any one second window
+    returned: when data was transferred
+    type: int
+    sample: 201326592
+ttfb:
+    description: seconds from the first transfer request to its response, null if none arrived
+    returned: when data was transferred
+    type: float
+    sample: 0.214
 '''
 
 
 import os
+import fnmatch
+import hashlib
+import json
 import tempfile
-import shutil
+import threading
+import time
 import traceback
 import re
 import datetime
 
+try:
+    from pyVmomi import vim
+except ImportError:
+    pass
+
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.six.moves import queue
 from ansible.module_utils.six.moves.urllib.parse import urlsplit, urlencode
-from ansible.module_utils._text import to_native
+from ansible.module_utils._text import to_bytes, to_native
 from ansible.module_utils.urls import fetch_url
+from ansible.module_utils.vsphere_transfer import (BUFSIZE, DatastoreSession, Throttle, connect_vsphere,
+                                                   find_datastore, find_datastore_host, wait_for_task)
+
+# granularity of zero block detection for sparse downloads
+SPARSE_BLOCK = 64 * 1024
+ZERO_BLOCK = b'\0' * SPARSE_BLOCK
+CONTENT_RANGE_RE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+GLOB_RE = re.compile(r'[*?[]')
 
 
 def vmware_path(datastore, datacenter, path):
@@ -242,11 +505,259 @@ def vmware_path(datastore, datacenter, path):
     return "%s?%s" % (path, params)
 
 
-def vmware_get(module, url, dest, last_mod_time, force, timeout, tmp_dest):
+class Digester(object):
+    """ Feed a single stream of data to several hashlib digests at once """
+    def __init__(self, algorithms):
+        self.hashes = dict()
+        for algorithm in algorithms:
+            try:
+                self.hashes[algorithm] = hashlib.new(algorithm)
+            except ValueError:
+                # md5 is not available on FIPS enabled systems
+                self.hashes[algorithm] = None
+
+    def update(self, data):
+        for h in self.hashes.values():
+            if h is not None:
+                h.update(data)
+
+    def update_from_file(self, path, length=None):
+        """ Digest the first length bytes of path, or all of it """
+        f = open(path, 'rb')
+        try:
+            remaining = length
+            while remaining is None or remaining > 0:
+                size = BUFSIZE if remaining is None else min(BUFSIZE, remaining)
+                buf = f.read(size)
+                if not buf:
+                    break
+                self.update(buf)
+                if remaining is not None:
+                    remaining -= len(buf)
+        finally:
+            f.close()
+
+    def hexdigests(self):
+        return dict((algorithm, h.hexdigest() if h is not None else None)
+                    for algorithm, h in self.hashes.items())
+
+
+def zero_blocks(buf):
+    """ Yield (offset, block, is_zero) for every SPARSE_BLOCK sized piece of buf """
+    for i in range(0, len(buf), SPARSE_BLOCK):
+        block = buf[i:i + SPARSE_BLOCK]
+        yield i, block, block == ZERO_BLOCK[:len(block)]
+
+
+def copy_stream(r, f, digester, sparse=False, throttle=None):
+    """
+    Copy a response body into a file object, digesting it on the way.
+    With sparse, all-zero blocks are seeked over instead of written.
+    Every read is accounted to throttle, when given.
+
+    Return the number of bytes skipped.
+    """
+    skipped = 0
+    while True:
+        buf = r.read(BUFSIZE)
+        if not buf:
+            break
+        if throttle is not None:
+            throttle.consume(len(buf))
+        digester.update(buf)
+        if not sparse:
+            f.write(buf)
+            continue
+        for i, block, is_zero in zero_blocks(buf):
+            if is_zero:
+                f.seek(len(block), os.SEEK_CUR)
+                skipped += len(block)
+            else:
+                f.write(block)
+    if sparse:
+        # trailing holes only extend the file once it is truncated to its length
+        f.truncate(f.tell())
+    return skipped
+
+
+def pwrite(fd, data, offset):
+    """ Positional write, falling back to seek+write where os.pwrite is missing """
+    if hasattr(os, 'pwrite'):
+        while data:
+            written = os.pwrite(fd, data, offset)
+            data = data[written:]
+            offset += written
+    else:
+        os.lseek(fd, offset, os.SEEK_SET)
+        while data:
+            written = os.write(fd, data)
+            data = data[written:]
+
+
+def parse_content_range(info):
+    """ Return (start, end, total) from a Content-Range header, or None """
+    match = CONTENT_RANGE_RE.match(info.get('content-range', ''))
+    if not match:
+        return None
+    total = match.group(3)
+    return int(match.group(1)), int(match.group(2)), None if total == '*' else int(total)
+
+
+def check_tmp_dest(module, tmp_dest):
+    """ tmp_dest should be an existing dir """
+    tmp_dest_is_dir = os.path.isdir(tmp_dest)
+    if not tmp_dest_is_dir:
+        if os.path.exists(tmp_dest):
+            module.fail_json(msg="%s is a file but should be a directory." % tmp_dest)
+        else:
+            module.fail_json(msg="%s directory does not exist." % tmp_dest)
+
+
+def make_tempfile(module, tmp_dest):
+    """ Create the temporary download file, return (fd, tempname) """
+    if tmp_dest:
+        check_tmp_dest(module, tmp_dest)
+        return tempfile.mkstemp(dir=tmp_dest)
+    return tempfile.mkstemp()
+
+
+def partial_paths(tmp_dest, url):
+    """ Return the stable (partial file, metadata file) paths used to resume url """
+    name = 'vsphere_fetch-%s.part' % hashlib.sha1(to_bytes(url)).hexdigest()
+    partname = os.path.join(tmp_dest or tempfile.gettempdir(), name)
+    return partname, partname + '.json'
+
+
+def load_partial_meta(metaname):
+    try:
+        with open(metaname) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def save_partial_meta(metaname, meta):
+    with open(metaname, 'w') as f:
+        json.dump(meta, f)
+
+
+def copy_range(r, fd, offset, length=None, sparse=False, throttle=None):
+    """
+    Copy a response body into fd at offset. With sparse, all-zero blocks
+    are not written, leaving holes in the preallocated file. Every read
+    is accounted to throttle, when given.
+
+    Return (bytes received, bytes skipped)
+    """
+    written = 0
+    skipped = 0
+    while length is None or written < length:
+        size = BUFSIZE
+        if length is not None:
+            size = min(size, length - written)
+        buf = r.read(size)
+        if not buf:
+            break
+        if throttle is not None:
+            throttle.consume(len(buf))
+        if not sparse:
+            pwrite(fd, buf, offset + written)
+        else:
+            for i, block, is_zero in zero_blocks(buf):
+                if is_zero:
+                    skipped += len(block)
+                else:
+                    pwrite(fd, block, offset + written + i)
+        written += len(buf)
+    return written, skipped
+
+
+def fetch_segments(module, url, tempname, ranges, concurrency, timeout, sparse=False, ticketer=None,
+                   throttle=None):
+    """
+    Fetch the given (start, end) byte ranges of url into tempname using
+    concurrency worker threads, each writing at its own offset.
+
+    Return (list of error strings, empty on success, bytes skipped)
+    """
+    work = queue.Queue()
+    for item in ranges:
+        work.put(item)
+    errors = []
+    completed = []
+    skipped = []
+
+    def worker():
+        fd = os.open(tempname, os.O_WRONLY)
+        try:
+            while not errors:
+                try:
+                    start, end = work.get_nowait()
+                except queue.Empty:
+                    return
+                r, info = fetch(module, url, ticketer, headers={'Range': 'bytes=%d-%d' % (start, end)},
+                                timeout=timeout, throttle=throttle)
+                if info['status'] != 206 or r is None:
+                    errors.append("range %d-%d failed: %s %s" % (start, end, info['status'], info.get('msg', '')))
+                    return
+                length = end - start + 1
+                try:
+                    written, range_skipped = copy_range(r, fd, start, length, sparse, throttle)
+                finally:
+                    r.close()
+                if written != length:
+                    errors.append("range %d-%d short read: got %d of %d bytes" % (start, end, written, length))
+                    return
+                completed.append(start)
+                skipped.append(range_skipped)
+        except Exception as e:
+            errors.append("range download failed: %s" % to_native(e))
+        finally:
+            os.close(fd)
+
+    threads = [threading.Thread(target=worker) for i in range(min(concurrency, len(ranges)))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join()
+    if not errors and len(completed) != len(ranges):
+        errors.append("only %d of %d ranges were downloaded" % (len(completed), len(ranges)))
+    return errors, sum(skipped)
+
+
+def fetch(module, url, ticketer=None, headers=None, method='GET', throttle=None, **kwargs):
+    """
+    fetch_url, adding a service ticket cookie when talking to an ESXi host
+    directly. With a throttle, starts its clock before the request and
+    records the arrival of the response as the first byte.
+    """
+    headers = dict(headers or {})
+    if ticketer is not None:
+        headers.update(ticketer.headers(url, method))
+    if throttle is not None:
+        throttle.begin()
+    r, info = fetch_url(module, url, headers=headers, method=method, **kwargs)
+    if throttle is not None and info['status'] in (200, 206):
+        throttle.first_byte()
+    return r, info
+
+
+def vmware_get(module, url, dest, last_mod_time, force, timeout, tmp_dest, concurrency=1, chunk_size=None,
+               algorithms=('sha1',), etag=None, sparse=False, ticketer=None, throttle=None):
     """
     Download the file from vsphere and store in a temporary file.
     Code based on get_url module
 
+    When concurrency is greater than 1, the first chunk_size bytes are
+    requested with a Range header. If the server honours it, the remaining
+    ranges are fetched in parallel into a preallocated temporary file,
+    otherwise the full response is streamed as usual.
+
+    The digests named in algorithms are computed while the response
+    streams in and returned in info['digests']. Segmented downloads arrive
+    out of order, so they are digested in one pass once complete.
+
     Return (tempfile, info about the request)
     """
     if module.check_mode:
@@ -254,8 +765,22 @@ def vmware_get(module, url, dest, last_mod_time, force, timeout, tmp_dest):
     else:
         method = 'GET'
 
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    segmented = concurrency > 1 and chunk_size
+    if segmented:
+        headers['Range'] = 'bytes=0-%d' % (chunk_size - 1)
+
     # I'm not sure if vmware does an ECONNRESET on download of file in use
-    r, info = fetch_url(module, url, force=force)
+    r, info = fetch(module, url, ticketer, force=force, headers=headers, last_mod_time=last_mod_time, timeout=timeout,
+                    throttle=throttle)
+
+    if segmented and info['status'] == 416:
+        # empty files cannot satisfy any range, ask for the whole thing
+        del headers['Range']
+        r, info = fetch(module, url, ticketer, force=force, headers=headers, last_mod_time=last_mod_time,
+                        timeout=timeout, throttle=throttle)
 
     if info['status'] == 304:
         module.exit_json(url=url, dest=dest, changed=False, msg=info.get('msg', ''))
@@ -264,36 +789,217 @@ def vmware_get(module, url, dest, last_mod_time, force, timeout, tmp_dest):
     if info['status'] == -1:
         module.fail_json(msg=info['msg'], url=url, dest=dest)
 
-    if info['status'] != 200:
+    if info['status'] not in (200, 206):
         module.fail_json(msg="Request failed", status_code=info['status'], response=info['msg'], url=url, dest=dest)
 
     # create a temporary file and copy content to do checksum-based replacement
-    if tmp_dest:
-        # tmp_dest should be an existing dir
-        tmp_dest_is_dir = os.path.isdir(tmp_dest)
-        if not tmp_dest_is_dir:
-            if os.path.exists(tmp_dest):
-                module.fail_json(msg="%s is a file but should be a directory." % tmp_dest)
-            else:
-                module.fail_json(msg="%s directory does not exist." % tmp_dest)
+    fd, tempname = make_tempfile(module, tmp_dest)
+    digester = Digester(algorithms)
 
-        fd, tempname = tempfile.mkstemp(dir=tmp_dest)
-    else:
-        fd, tempname = tempfile.mkstemp()
+    content_range = None
+    if info['status'] == 206:
+        content_range = parse_content_range(info)
+        if content_range is None or content_range[2] is None:
+            os.close(fd)
+            os.remove(tempname)
+            module.fail_json(msg="Server returned an unusable Content-Range header", url=url, dest=dest,
+                             content_range=info.get('content-range'))
 
-    f = os.fdopen(fd, 'wb')
     try:
-        shutil.copyfileobj(r, f)
+        if content_range:
+            start, end, total = content_range
+            # preallocate so every range can be written in place, this is a
+            # hole until written which also makes sparse downloads sparse
+            os.ftruncate(fd, total)
+            written, skipped = copy_range(r, fd, start, end - start + 1, sparse, throttle)
+            if written != end - start + 1:
+                raise Exception("short read on the first range")
+            ranges = [(offset, min(offset + chunk_size, total) - 1)
+                      for offset in range(end + 1, total, chunk_size)]
+            errors, range_skipped = fetch_segments(module, url, tempname, ranges, concurrency, timeout,
+                                                   sparse, ticketer, throttle)
+            if errors:
+                raise Exception('; '.join(errors))
+            info['segments'] = len(ranges) + 1
+            info['sparse_skipped'] = skipped + range_skipped
+            digester.update_from_file(tempname)
+        else:
+            f = os.fdopen(fd, 'wb')
+            fd = None
+            info['sparse_skipped'] = copy_stream(r, f, digester, sparse, throttle)
+            f.close()
     except Exception as e:
+        if fd is not None:
+            os.close(fd)
         os.remove(tempname)
-        module.fail_json(msg="{0} {1}".format(str(r), str(info)))
         module.fail_json(msg="failed to create temporary content file: %s" % to_native(e),
                          exception=traceback.format_exc())
-    f.close()
+    if fd is not None:
+        os.close(fd)
     r.close()
+    info['digests'] = digester.hexdigests()
     return tempname, info
 
 
+def vmware_get_resume(module, url, dest, force, timeout, tmp_dest, retries, retry_delay, algorithms=('sha1',),
+                      sparse=False, ticketer=None, throttle=None):
+    """
+    Download the file from vsphere into a stable partial file, continuing
+    an earlier partial download with a Range request when the remote file
+    still has the recorded size and Last-Modified time. Failed attempts are
+    retried with exponential backoff, keeping the data received so far.
+    Digests are computed over the kept partial data and then while the
+    rest streams in.
+
+    Return (tempfile, info about the request)
+    """
+    if tmp_dest:
+        check_tmp_dest(module, tmp_dest)
+    partname, metaname = partial_paths(tmp_dest, url)
+    meta = load_partial_meta(metaname)
+    if meta.get('url') != url:
+        meta = {}
+
+    attempt = 0
+    resumed_from = 0
+    skipped = 0
+    while True:
+        offset = 0
+        if meta and os.path.exists(partname):
+            offset = os.path.getsize(partname)
+
+        headers = {}
+        if offset:
+            headers['Range'] = 'bytes=%d-' % offset
+            if meta.get('last_modified'):
+                headers['If-Range'] = meta['last_modified']
+
+        r, info = fetch(module, url, ticketer, force=force, headers=headers, timeout=timeout, throttle=throttle)
+        status = info['status']
+        error = None
+
+        if status == 416 and offset and offset == meta.get('size'):
+            # the previous attempt already received everything
+            resumed_from = offset
+            digester = Digester(algorithms)
+            digester.update_from_file(partname)
+            break
+        elif status == 200:
+            offset = 0
+            size = info.get('content-length')
+            meta = dict(url=url, size=int(size) if size else None, last_modified=info.get('last-modified'))
+        elif status == 206:
+            content_range = parse_content_range(info)
+            last_modified = info.get('last-modified')
+            if (content_range is None or content_range[0] != offset or content_range[2] != meta.get('size') or
+                    (last_modified and meta.get('last_modified') and last_modified != meta['last_modified'])):
+                # the remote file changed since the partial download, start over
+                r.close()
+                os.remove(partname)
+                meta = {}
+                error = "remote file changed since the partial download"
+        elif status == -1 or status >= 500:
+            error = info.get('msg', 'Request failed')
+        else:
+            module.fail_json(msg="Request failed", status_code=status, response=info.get('msg'), url=url, dest=dest)
+
+        if error is None:
+            resumed_from = offset
+            save_partial_meta(metaname, meta)
+            digester = Digester(algorithms)
+            try:
+                if offset:
+                    digester.update_from_file(partname, offset)
+                # seek rather than append, so sparse holes can be skipped over
+                f = open(partname, 'r+b' if offset else 'wb')
+                f.seek(offset)
+                try:
+                    skipped = copy_stream(r, f, digester, sparse, throttle)
+                finally:
+                    f.close()
+                    r.close()
+            except Exception as e:
+                error = to_native(e)
+            else:
+                size = os.path.getsize(partname)
+                if meta.get('size') is not None and size != meta['size']:
+                    error = "short read: got %d of %d bytes" % (size, meta['size'])
+                else:
+                    break
+
+        attempt += 1
+        if attempt > retries:
+            module.fail_json(msg="Download failed after %d attempts: %s" % (attempt, error),
+                             url=url, dest=dest, partial=partname)
+        time.sleep(retry_delay * 2 ** (attempt - 1))
+
+    os.remove(metaname)
+    info['digests'] = digester.hexdigests()
+    info['resumed_from'] = resumed_from
+    info['sparse_skipped'] = skipped
+    info['attempts'] = attempt + 1
+    return partname, info
+
+
+def manifest_path(dest):
+    """ Return the path of the hidden sidecar manifest of dest """
+    return os.path.join(os.path.dirname(dest), '.%s.vsphere_fetch' % os.path.basename(dest))
+
+
+def load_manifest(dest, url):
+    """
+    Return the manifest entry recorded for dest, or None when there is
+    none or it no longer describes the local file.
+    """
+    try:
+        with open(manifest_path(dest)) as f:
+            entry = json.load(f)
+        st = os.stat(dest)
+    except (IOError, OSError, ValueError):
+        return None
+    if entry.get('url') != url or entry.get('size') != st.st_size or entry.get('mtime') != st.st_mtime:
+        return None
+    return entry
+
+
+def save_manifest(dest, url, info, digests):
+    st = os.stat(dest)
+    entry = dict(url=url, last_modified=info.get('last-modified'), etag=info.get('etag'),
+                 size=st.st_size, mtime=st.st_mtime, sha1=digests.get('sha1'))
+    with open(manifest_path(dest), 'w') as f:
+        json.dump(entry, f)
+
+
+def remote_unchanged(module, url, entry, timeout, ticketer=None):
+    """
+    Make a conditional HEAD request against the manifest entry, return
+    True when the remote file is known to be unchanged.
+    """
+    headers = dict()
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    if not headers:
+        return False
+
+    r, info = fetch(module, url, ticketer, headers=headers, method='HEAD', timeout=timeout)
+    if r is not None:
+        r.close()
+    if info['status'] == 304:
+        return True
+    if info['status'] != 200:
+        # the server may not implement HEAD, let the download decide
+        return False
+
+    size = info.get('content-length')
+    if size is None or int(size) != entry['size']:
+        return False
+    if entry.get('etag') and info.get('etag'):
+        return info['etag'] == entry['etag']
+    return bool(entry.get('last_modified')) and info.get('last-modified') == entry['last_modified']
+
+
 def extract_filename_from_headers(headers):
     """
     Extracts a filename from the given dict of HTTP headers.
@@ -322,6 +1028,210 @@ def url_filename(url):
     return fn
 
 
+def is_multi_src(src):
+    """ True if src names a directory or a glob rather than a single file """
+    return src.endswith('/') or GLOB_RE.search(src) is not None
+
+
+def split_glob(src):
+    """ Split src into its literal leading folder and the wildcard pattern below it """
+    parts = src.strip('/').split('/')
+    prefix = []
+    for part in parts:
+        if GLOB_RE.search(part):
+            break
+        prefix.append(part)
+    if src.endswith('/'):
+        return '/'.join(prefix), None
+    return '/'.join(prefix), parts[len(prefix):]
+
+
+def glob_match(relpath, pattern):
+    """ Match relpath against pattern one path component at a time """
+    if pattern is None:
+        return True
+    parts = relpath.split('/')
+    if len(parts) != len(pattern):
+        return False
+    return all(fnmatch.fnmatchcase(p, g) for p, g in zip(parts, pattern))
+
+
+def session_cookie(si):
+    """ Return the vmware_soap_session cookie of a pyVmomi login, usable on /folder """
+    return si._stub.cookie.split(';')[0].strip()
+
+
+def expand_src(module, ds, src):
+    """
+    Expand a directory or glob src with the datastore browser.
+
+    Return a list of (path on the datastore, path relative to the literal
+    prefix of src, size) for every matching file.
+    """
+    prefix, pattern = split_glob(src)
+    root = '[%s] %s' % (ds.name, prefix)
+    spec = vim.host.DatastoreBrowser.SearchSpec(
+        details=vim.host.DatastoreBrowser.FileInfo.Details(fileType=True, fileSize=True),
+    )
+    if pattern is not None and len(pattern) == 1:
+        task = ds.browser.SearchDatastore_Task(datastorePath=root, searchSpec=spec)
+    else:
+        task = ds.browser.SearchDatastoreSubFolders_Task(datastorePath=root, searchSpec=spec)
+    try:
+        wait_for_task(task)
+    except Exception as e:
+        module.fail_json(msg="Failed to list %s: %s" % (root, to_native(e)))
+    results = task.info.result
+    if not isinstance(results, list):
+        results = [results] if results else []
+
+    files = []
+    for listing in results:
+        folder = listing.folderPath.split(']', 1)[1].strip().strip('/')
+        for info in listing.file or []:
+            if isinstance(info, vim.host.DatastoreBrowser.FolderInfo):
+                continue
+            path = '/'.join(p for p in (folder, info.path) if p)
+            relpath = path[len(prefix):].lstrip('/') if prefix else path
+            if glob_match(relpath, pattern):
+                files.append((path, relpath, info.fileSize))
+    return files
+
+
+class HostTicketer(object):
+    """ Acquires single use service tickets for requests sent straight to an ESXi host """
+    METHODS = dict(GET='httpGet', HEAD='httpHead', PUT='httpPut', DELETE='httpDelete')
+
+    def __init__(self, content):
+        self.content = content
+        self.lock = threading.Lock()
+
+    def headers(self, url, method='GET'):
+        spec = vim.SessionManager.HttpServiceRequestSpec(method=self.METHODS[method], url=url)
+        with self.lock:
+            ticket = self.content.sessionManager.AcquireGenericServiceTicket(spec)
+        return {'Cookie': 'vmware_cgi_ticket=%s' % ticket.id}
+
+
+def fetch_tree(module, host, datacenter, datastore, src, dest, force, timeout, concurrency, sparse=False,
+               transfer_via='vcenter', throttle=None):
+    """ Download every file matching a directory or glob src into the dest directory """
+    if not os.path.isdir(dest):
+        module.fail_json(msg="dest %s must be an existing directory when src is a directory or a glob" % dest)
+
+    si, content = connect_vsphere(module, module.params['url_username'], module.params['url_password'])
+    ds = find_datastore(module, content, datacenter, datastore)
+    files = expand_src(module, ds, src)
+
+    results = []
+    work = queue.Queue()
+    for path, relpath, size in files:
+        local = os.path.join(dest, relpath)
+        result = dict(src=path, dest=local, size=size, changed=False)
+        results.append(result)
+        if os.path.exists(local) and not force:
+            result['msg'] = 'file already exists'
+            continue
+        if module.check_mode:
+            result['changed'] = True
+            continue
+        result['pending'] = True
+        work.put(result)
+
+    ticketer = None
+    dc_path = datacenter
+    if transfer_via == 'host':
+        host = find_datastore_host(module, ds).name
+        ticketer = HostTicketer(content)
+        dc_path = 'ha-datacenter'
+        headers = {}
+    else:
+        headers = {'Cookie': session_cookie(si)}
+
+    def worker():
+        session = DatastoreSession(host, module.params['validate_certs'], timeout, throttle=throttle, headers=headers)
+        try:
+            while True:
+                try:
+                    result = work.get_nowait()
+                except queue.Empty:
+                    return
+                tempname = None
+                try:
+                    path = vmware_path(datastore, dc_path, result['src'])
+                    ticket = ticketer.headers('https://%s%s' % (host, path)) if ticketer else None
+                    resp = session.send('GET', path, ticket)
+                    result['status'] = resp.status
+                    if resp.status != 200:
+                        resp.read()
+                        result['failed'] = True
+                        result['msg'] = resp.reason
+                        continue
+                    local_dir = os.path.dirname(result['dest'])
+                    if not os.path.isdir(local_dir):
+                        try:
+                            os.makedirs(local_dir)
+                        except OSError:
+                            # another worker created it first
+                            if not os.path.isdir(local_dir):
+                                raise
+                    fd, tempname = tempfile.mkstemp(dir=local_dir)
+                    digester = Digester(['sha1'])
+                    f = os.fdopen(fd, 'wb')
+                    try:
+                        result['sparse_skipped'] = copy_stream(resp, f, digester, sparse, throttle)
+                    finally:
+                        f.close()
+                    result['checksum'] = digester.hexdigests()['sha1']
+                    result['tmpsrc'] = tempname
+                except Exception as e:
+                    session.close()
+                    result['failed'] = True
+                    result['msg'] = to_native(e)
+                    if tempname and os.path.exists(tempname):
+                        os.remove(tempname)
+                finally:
+                    result.pop('pending', None)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=worker) for i in range(min(concurrency, work.qsize()))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join()
+
+    # moves and attribute changes may call fail_json, so they stay in the main thread
+    failed = False
+    for result in results:
+        tmpsrc = result.pop('tmpsrc', None)
+        if result.pop('pending', False):
+            result['failed'] = True
+            result['msg'] = 'not downloaded'
+        if result.get('failed'):
+            failed = True
+            continue
+        if tmpsrc:
+            if os.path.exists(result['dest']) and module.sha1(result['dest']) == result['checksum']:
+                os.remove(tmpsrc)
+            else:
+                module.atomic_move(tmpsrc, result['dest'])
+                result['changed'] = True
+        if os.path.exists(result['dest']):
+            module.params['path'] = result['dest']
+            file_args = module.load_file_common_arguments(module.params)
+            file_args['path'] = result['dest']
+            result['changed'] = module.set_fs_attributes_if_different(file_args, result['changed'])
+
+    changed = any(result['changed'] for result in results)
+    stats = throttle.stats() if throttle is not None else {}
+    if failed:
+        module.fail_json(msg="Failed to fetch some files", files=results, changed=changed, **stats)
+    module.exit_json(changed=changed, dest=dest, src=src, datacenter=datacenter, datastore=datastore,
+                     files=results, **stats)
+
+
 def main():
 
     module = AnsibleModule(
@@ -338,6 +1248,16 @@ def main():
             timeout=dict(type='int', default=10),
             force=dict(default='no', aliases=['thirsty'], type='bool'),
             validate_certs=dict(required=False, default=True, type='bool'),
+            concurrency=dict(type='int', default=1),
+            chunk_size=dict(type='int', default=64 * 1024 * 1024),
+            resume=dict(type='bool', default=False),
+            retries=dict(type='int', default=3),
+            retry_delay=dict(type='int', default=5),
+            checksum=dict(default=''),
+            manifest=dict(type='bool', default=False),
+            sparse=dict(type='bool', default=False),
+            transfer_via=dict(default='vcenter', choices=['vcenter', 'host']),
+            max_bandwidth=dict(type='int'),
         ),
         supports_check_mode=True,
         add_file_common_args=True,
@@ -355,15 +1275,90 @@ def main():
     backup = module.params.get('backup')
     force = module.params.get('force')
     timeout = module.params.get('timeout')
+    concurrency = module.params.get('concurrency')
+    chunk_size = module.params.get('chunk_size')
+    resume = module.params.get('resume')
+    retries = module.params.get('retries')
+    retry_delay = module.params.get('retry_delay')
+    checksum = module.params.get('checksum')
+    manifest = module.params.get('manifest')
+    sparse = module.params.get('sparse')
+    transfer_via = module.params.get('transfer_via')
+
+    # sha1 backs checksum_src/checksum_dest, md5 the md5sum return value
+    algorithms = ['sha1', 'md5']
+    if checksum:
+        try:
+            algorithm, checksum = checksum.rsplit(':', 1)
+            checksum = checksum.lower()
+            hashlib.new(algorithm)
+        except ValueError:
+            module.fail_json(msg="The checksum parameter has to be in format <algorithm>:<checksum> "
+                                 "with an algorithm supported by hashlib")
+        if algorithm not in algorithms:
+            algorithms.append(algorithm)
+
+    if concurrency < 1:
+        module.fail_json(msg="concurrency must be at least 1")
+    if chunk_size < 1:
+        module.fail_json(msg="chunk_size must be at least 1")
+    if module.params['max_bandwidth'] is not None and module.params['max_bandwidth'] < 1:
+        module.fail_json(msg="max_bandwidth must be at least 1")
+    throttle = Throttle(module.params['max_bandwidth'])
+
+    if is_multi_src(src):
+        single = [name for name in ('checksum', 'manifest', 'resume', 'backup') if module.params[name]]
+        if single:
+            module.fail_json(msg="%s cannot be used when src is a directory or a glob" % ', '.join(single))
+        fetch_tree(module, host=host, datacenter=datacenter, datastore=datastore, src=src, dest=dest,
+                   force=force, timeout=timeout, concurrency=concurrency, sparse=sparse,
+                   transfer_via=transfer_via, throttle=throttle)
 
     dest_is_dir = os.path.isdir(dest)
     last_mod_time = None
+    etag = None
 
-    remote_path = vmware_path(datastore, datacenter, src)
-    url = 'https://%s%s' % (host, remote_path)
+    if sparse and not tmp_dest:
+        # a rename keeps the holes, a copy across filesystems would fill them
+        tmp_dest = dest if dest_is_dir else os.path.dirname(dest)
+
+    ticketer = None
+    transfer_host = None
+    if transfer_via == 'host':
+        si, content = connect_vsphere(module, module.params['url_username'], module.params['url_password'])
+        transfer_host = find_datastore_host(module, find_datastore(module, content, datacenter, datastore)).name
+        ticketer = HostTicketer(content)
+        # an ESXi host only knows its own datacenter
+        remote_path = vmware_path(datastore, 'ha-datacenter', src)
+        url = 'https://%s%s' % (transfer_host, remote_path)
+    else:
+        remote_path = vmware_path(datastore, datacenter, src)
+        url = 'https://%s%s' % (host, remote_path)
+
+    if manifest:
+        local_file = dest
+        if dest_is_dir:
+            local_file = os.path.join(dest, url_filename(url))
+        entry = load_manifest(local_file, url)
+        if entry and not checksum and (force or dest_is_dir):
+            if remote_unchanged(module, url, entry, timeout, ticketer):
+                module.params['path'] = local_file
+                file_args = module.load_file_common_arguments(module.params)
+                file_args['path'] = local_file
+                changed = module.set_fs_attributes_if_different(file_args, False)
+                module.exit_json(msg="remote file not modified", dest=local_file, url=url, changed=changed)
+            etag = entry.get('etag')
 
     if not dest_is_dir and os.path.exists(dest):
-        if not force:
+        checksum_mismatch = False
+        if checksum:
+            # a matching local copy makes the download unnecessary, even when forced
+            if module.digest_from_file(dest, algorithm) == checksum:
+                force = False
+            else:
+                checksum_mismatch = True
+
+        if not force and not checksum_mismatch:
             # allow file attribute changes
             module.params['path'] = dest
             file_args = module.load_file_common_arguments(module.params)
@@ -374,13 +1369,27 @@ def main():
                 module.exit_json(msg="file already exists but file attributes changed", dest=dest, url=url, changed=changed)
             module.exit_json(msg="file already exists", dest=dest, url=url, changed=changed)
 
-        # If the file already exists, prepare the last modified time for the
-        # request.
-        mtime = os.path.getmtime(dest)
-        last_mod_time = datetime.datetime.utcfromtimestamp(mtime)
+        if checksum_mismatch:
+            # the local copy is known to be wrong, a 304 must not keep it
+            etag = None
+        else:
+            # If the file already exists, prepare the last modified time for the
+            # request.
+            mtime = os.path.getmtime(dest)
+            last_mod_time = datetime.datetime.utcfromtimestamp(mtime)
 
-    tmpsrc, info = vmware_get(module, url=url, dest=dest, last_mod_time=last_mod_time,
-                              force=force, timeout=timeout, tmp_dest=tmp_dest)
+    if resume:
+        tmpsrc, info = vmware_get_resume(module, url=url, dest=dest, force=force, timeout=timeout,
+                                         tmp_dest=tmp_dest, retries=retries, retry_delay=retry_delay,
+                                         algorithms=algorithms, sparse=sparse, ticketer=ticketer,
+                                         throttle=throttle)
+    else:
+        tmpsrc, info = vmware_get(module, url=url, dest=dest, last_mod_time=last_mod_time,
+                                  force=force, timeout=timeout, tmp_dest=tmp_dest,
+                                  concurrency=concurrency, chunk_size=chunk_size,
+                                  algorithms=algorithms, etag=etag, sparse=sparse, ticketer=ticketer,
+                                  throttle=throttle)
+    digests = info['digests']
 
     if dest_is_dir:
         filename = extract_filename_from_headers(info)
@@ -404,7 +1413,11 @@ def main():
     if not os.access(tmpsrc, os.R_OK):
         os.remove(tmpsrc)
         module.fail_json(msg="Source %s is not readable" % (tmpsrc))
-    checksum_src = module.sha1(tmpsrc)
+    checksum_src = digests['sha1']
+
+    if checksum and digests[algorithm] != checksum:
+        os.remove(tmpsrc)
+        module.fail_json(msg="The checksum for %s did not match %s; it was %s." % (dest, checksum, digests[algorithm]))
 
     # check if there is no dest file
     if os.path.exists(dest):
@@ -442,19 +1455,28 @@ def main():
     file_args['path'] = dest
     changed = module.set_fs_attributes_if_different(file_args, changed)
 
+    if manifest:
+        save_manifest(dest, url, info, digests)
+
     # Backwards compat only.  We'll return None on FIPS enabled systems
-    try:
-        md5sum = module.md5(dest)
-    except ValueError:
-        md5sum = None
+    md5sum = digests['md5']
 
     res_args = dict(
         url=url, dest=dest, src=tmpsrc, md5sum=md5sum, datacenter=datacenter,
+        checksum_src=checksum_src, checksum_dest=checksum_src,
         datastore=datastore, changed=changed, msg=info.get('msg', ''),
-        status_code=info.get('status', '')
+        status_code=info.get('status', ''), segments=info.get('segments', 1)
     )
     if backup_file:
         res_args['backup_file'] = backup_file
+    if transfer_host:
+        res_args['transfer_host'] = transfer_host
+    if sparse:
+        res_args['sparse_skipped'] = info['sparse_skipped']
+    if resume:
+        res_args['resumed_from'] = info['resumed_from']
+        res_args['attempts'] = info['attempts']
+    res_args.update(throttle.stats())
 
     # Mission complete
     module.exit_json(**res_args)
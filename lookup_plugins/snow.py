@@ -39,6 +39,63 @@ DOCUMENTATION = '''
             description: The field to compare each term against
             required: False
             default: "number"
+        max_url_length:
+            description:
+                - Terms are looked up together, in as few C(lookup_field IN (...)) queries
+                  as fit in URLs of at most this many characters.
+                - The length of a URL counts the instance, the table, the requested fields
+                  and every other sysparm_ parameter sent, and carets escaped as C(^^).
+                - Terms containing a comma cannot be part of an IN query and are looked up
+                  one at a time.
+            type: int
+            required: False
+            default: 2048
+        match:
+            description:
+                - How each term is compared with C(lookup_field).
+                - Only C(equals) terms can be batched into IN queries, the others are
+                  looked up with one query per term, on C(max_workers) threads.
+            required: False
+            default: equals
+            choices: [equals, contains, starts_with, ends_with]
+        max_workers:
+            description:
+                - Number of queries run at the same time, each worker on an HTTP session of its own.
+                - When Service-Now answers 429 Too Many Requests, every worker pauses for
+                  its Retry-After time, or an exponential backoff, before trying again.
+            type: int
+            required: False
+            default: 4
+        cache:
+            description:
+                - Cache the result of every term, in process and on disk, so re-rendering a
+                  lookup for every host and task does not query Service-Now again.
+                - Entries are keyed on instance, username, table, lookup_field, result_fields and term.
+            type: bool
+            required: False
+            default: False
+        cache_ttl:
+            description: Seconds a cached result is used for
+            type: int
+            required: False
+            default: 300
+        cache_negative_ttl:
+            description: Seconds a cached C(ENOENT) result, for a term that matched nothing, is used for
+            type: int
+            required: False
+            default: 60
+        cache_dir:
+            description: Directory holding the on-disk cache, shared by all forks and runs
+            required: False
+            default: ~/.ansible/tmp/snow_lookup
+        cache_max_size:
+            description:
+                - Size in bytes the on-disk cache is kept under. The least recently used
+                  entries are evicted first.
+            type: int
+            required: False
+            default: 10485760
+    extends_documentation_fragment: snow_sysparm
 '''
 
 EXAMPLES = '''
@@ -63,6 +120,14 @@ EXAMPLES = '''
     - name: check for incident numbered INC0000055
       debug: msg={{ lookup("snow", "INC0000055", context=snow_context) }}
 
+    - name: Cache lookups used in vars, so they are not repeated for every host
+      debug: msg={{ lookup("snow", "INC0000055", context=snow_context, cache=True, cache_ttl=600) }}
+
+    - name: Find the CIs whose names start with any of several prefixes
+      debug: msg={{ lookup("snow", "web", "db", "cache", instance='dev18962', username='ansible_test',
+                           password='my_password', table='cmdb_ci', lookup_field='name',
+                           match='starts_with', max_workers=3, result_fields=['name']) }}
+
     - name: Find all records in the incident table that are on hold, full variable definition
       debug: msg={{ lookup("snow", "2", instance='dev18962', username='ansible_test',
                            password='my_password', table='incident', lookup_field='state', result_fields=['sys_id']) }}
@@ -77,15 +142,24 @@ RETURN = '''
         type: list
 '''
 
+import hashlib
+import json
 import os
+import threading
+import time
+from collections import OrderedDict
 
 from ansible.errors import AnsibleError
+from ansible.module_utils.six.moves import queue
+from ansible.module_utils._text import to_bytes, to_text
+from ansible.module_utils.parsing.convert_bool import boolean
 from ansible.plugins.lookup import LookupBase
 
 # Pull in pysnow
 HAS_PYSNOW = False
 try:
     import pysnow
+    import requests
     HAS_PYSNOW = True
 
 except ImportError:
@@ -98,40 +172,334 @@ except ImportError:
     display = Display()
 
 
-def snow_get(key, instance=None, username=None, password=None, table=None, lookup_field=None, result_fields=None):
+def load_module_utils(name):
+    """ Load module_utils/<name>.py of this repo, which Ansible only puts on the search path of modules """
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'module_utils', name + '.py')
+    try:
+        from importlib.util import module_from_spec, spec_from_file_location
+    except ImportError:
+        import imp
+        return imp.load_source(name, path)
+    spec = spec_from_file_location(name, path)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+snow_common = load_module_utils('snow_common')
+
+
+MATCH_CHOICES = ('equals', 'contains', 'starts_with', 'ends_with')
+
+# in-process layer of SnowLookupCache, shared by every lookup in this process
+MEMORY_CACHE = OrderedDict()
+MEMORY_CACHE_ENTRIES = 10000
+
+
+class SnowLookupCache(object):
+    """ Two level TTL cache of per-term lookup results: in process, then on disk """
+    def __init__(self, cache_dir, ttl, negative_ttl, max_size, *context):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.prefix = json.dumps(context)
+        self.written = False
+
+    def key(self, term):
+        return hashlib.sha1(to_bytes('%s|%s' % (self.prefix, term))).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def get(self, term):
+        """ Return the cached value of term, or None """
+        key = self.key(term)
+        now = time.time()
+        entry = MEMORY_CACHE.pop(key, None)
+        if entry is None:
+            try:
+                with open(self.path(key)) as f:
+                    entry = json.load(f)
+                # the mtime orders entries for LRU eviction
+                os.utime(self.path(key), None)
+            except (IOError, OSError, ValueError):
+                return None
+        if entry['expires'] < now:
+            return None
+        MEMORY_CACHE[key] = entry
+        return entry['value']
+
+    def set(self, term, value):
+        """ Cache value, atomically on disk, failures only cost a cache miss """
+        ttl = self.negative_ttl if value == ['ENOENT'] else self.ttl
+        if ttl <= 0:
+            return
+        key = self.key(term)
+        entry = dict(expires=time.time() + ttl, value=value)
+        MEMORY_CACHE.pop(key, None)
+        MEMORY_CACHE[key] = entry
+        while len(MEMORY_CACHE) > MEMORY_CACHE_ENTRIES:
+            MEMORY_CACHE.popitem(last=False)
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            tmp = '%s.%d.tmp' % (self.path(key), os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(entry, f)
+            os.rename(tmp, self.path(key))
+            self.written = True
+        except (IOError, OSError):
+            pass
+
+    def evict(self):
+        """ Remove expired entries, then the least recently used ones until under max_size """
+        if not self.written:
+            return
+        now = time.time()
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size and mtime + max(self.ttl, self.negative_ttl) >= now:
+                # everything newer is both within the size limit and possibly fresh
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+class SharedBackoff(object):
+    """ A pause shared by every thread of a lookup, started when Service-Now answers 429 """
+    def __init__(self, retries=5, delay=1):
+        self.retries = retries
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.until = 0
+
+    def wait(self):
+        while True:
+            with self.lock:
+                remaining = self.until - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def start(self, attempt, retry_after=None):
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = self.delay * 2 ** attempt
+        with self.lock:
+            self.until = max(self.until, time.time() + delay)
+
+
+if HAS_PYSNOW:
+    class BackoffAdapter(requests.adapters.HTTPAdapter):
+        """ Connection pool that holds every request back while a 429 backoff is running """
+        def __init__(self, backoff, **kwargs):
+            self.backoff = backoff
+            super(BackoffAdapter, self).__init__(**kwargs)
+
+        def send(self, request, **kwargs):
+            for attempt in range(self.backoff.retries + 1):
+                self.backoff.wait()
+                response = super(BackoffAdapter, self).send(request, **kwargs)
+                if response.status_code != 429 or attempt == self.backoff.retries:
+                    return response
+                self.backoff.start(attempt, response.headers.get('Retry-After'))
+                response.close()
+
+
+def display_values(values):
+    """ Replace the value/display_value dict of every field by its display value """
+    def pick(field):
+        if isinstance(field, dict) and 'display_value' in field:
+            return field['display_value']
+        return field
+
+    result = []
+    for value in values:
+        if isinstance(value, dict) and 'display_value' not in value:
+            value = dict((k, pick(v)) for k, v in value.items())
+        result.append(pick(value))
+    return result
+
+
+def snow_client(instance=None, username=None, password=None, params=None, session=None, backoff=None):
+    """
+    pysnow client for params, on session when given to share its connection,
+    otherwise on a new session paused by backoff when Service-Now answers 429
+    """
     if not HAS_PYSNOW:
         raise AnsibleError("Service-Now lookup requires pysnow to be installed")
-    value = []
     if instance is None:
         raise AnsibleError("Service-Now: No instance specified")
     if username is None:
         raise AnsibleError("Service-Now: No username specified")
     if password is None:
         raise AnsibleError("Service-Now: No password specified")
-    if table is None:
-        raise AnsibleError("Service-Now: No table specified")
-    if lookup_field is None:
-        raise AnsibleError("Service-Now: No lookup_field specified")
 
+    if session is None:
+        session = requests.Session()
+        session.auth = (username, password)
+        session.mount('https://', BackoffAdapter(backoff or SharedBackoff(), pool_connections=1, pool_maxsize=1))
     try:
-        conn = pysnow.Client(instance=instance, user=username, password=password)
+        return pysnow.Client(instance=instance, session=session, request_params=params or {})
     except Exception as detail:
         raise AnsibleError("Could not connect to ServiceNow: {0}".format(str(detail)))
+
+
+def format_record(res, result_fields):
+    if len(result_fields) == 1:
+        # we have single field results, make a simpler list
+        return res[result_fields[0]]
+    return dict((k, v) for k, v in res.items() if not result_fields or k in result_fields)
+
+
+def field_value(value):
+    """ Reference fields come back as a dict with a link and a value """
+    if isinstance(value, dict):
+        value = value.get('value')
+    return to_text(value if value is not None else '')
+
+
+def snow_get(conn, key, table=None, lookup_field=None, result_fields=None, match='equals'):
+    value = []
     try:
-        record = conn.query(table=table, query={lookup_field: key})
+        if match == 'equals':
+            query = '%s=%s' % (lookup_field, snow_common.escape(key))
+        else:
+            query = pysnow.QueryBuilder().field(lookup_field)
+            getattr(query, match)(key)
+        record = conn.query(table=table, query=query)
         for res in record.get_multiple(fields=result_fields):
-            if len(result_fields) == 1:
-                # we have single field results, make a simpler list
-                value.append(res[result_fields[0]])
-            else:
-                value.append(res)
+            value.append(format_record(res, result_fields))
 
     except pysnow.exceptions.NoResults:
         return ['ENOENT']
     except Exception as detail:
         raise AnsibleError("Unknown failure in query record: {0}".format(str(detail)))
 
-    return value
+    return value or ['ENOENT']
+
+
+def snow_get_chunk(conn, chunk, query, table, lookup_field, result_fields):
+    """ Look up the terms of chunk with one encoded query, return a dict of term -> list of results or ['ENOENT'] """
+    # the lookup field is needed to tell which term a record belongs to
+    fields = list(result_fields)
+    if fields and lookup_field not in fields:
+        fields.append(lookup_field)
+
+    found = dict()
+    try:
+        record = conn.query(table=table, query=query)
+        for res in record.get_multiple(fields=fields):
+            found.setdefault(field_value(res.get(lookup_field)), []).append(res)
+    except pysnow.exceptions.NoResults:
+        pass
+    except Exception as detail:
+        raise AnsibleError("Unknown failure in query record: {0}".format(str(detail)))
+
+    # ServiceNow compares strings case insensitively
+    folded = dict()
+    for key, records in found.items():
+        folded.setdefault(key.lower(), []).extend(records)
+    values = dict()
+    for term in chunk:
+        records = found.get(term) or folded.get(term.lower())
+        if records:
+            values[term] = [format_record(res, result_fields) for res in records]
+        else:
+            values[term] = ['ENOENT']
+    return values
+
+
+def snow_get_many(clients, terms, instance=None, table=None, lookup_field=None, result_fields=None,
+                  max_url_length=2048, match='equals', max_workers=1):
+    """
+    Look up all terms with as few lookup_field IN queries as fit in
+    max_url_length, and split the records back per term. Terms holding a
+    comma, and terms matched other than by equals, get a query of their
+    own. All queries run on up to max_workers threads, each on a
+    (conn, chunk_conn) pair of pysnow clients checked out of the clients
+    SessionPool. The IN queries go through chunk_conn.
+
+    Return a dict of term -> list of results, or ['ENOENT'] when a term matched nothing
+    """
+    unique = []
+    seen = set()
+    for term in terms:
+        if term not in seen:
+            seen.add(term)
+            unique.append(term)
+
+    # everything sent besides the terms, as snow_get_chunk asks for it
+    fields = list(result_fields)
+    if fields and lookup_field not in fields:
+        fields.append(lookup_field)
+    with clients.session() as (conn, chunk_conn):
+        sysparms = dict(chunk_conn.request_params, **snow_common.PAGING_PLACEHOLDER)
+    if fields:
+        sysparms['sysparm_fields'] = ','.join(fields)
+
+    work = queue.Queue()
+    if match != 'equals':
+        for term in unique:
+            work.put((snow_get, (term, table, lookup_field, result_fields, match), term))
+    else:
+        url = 'https://%s.service-now.com/api/now/table/%s' % (instance, table)
+        for chunk, query in snow_common.in_queries(lookup_field, unique, url, sysparms, max_url_length):
+            work.put((snow_get_chunk, (chunk, query, table, lookup_field, result_fields), None))
+
+    values = dict()
+    errors = []
+
+    def worker():
+        with clients.session() as (conn, chunk_conn):
+            while not errors:
+                try:
+                    func, args, term = work.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    result = func(chunk_conn if term is None else conn, *args)
+                except Exception as detail:
+                    errors.append(detail)
+                    return
+                if term is None:
+                    values.update(result)
+                else:
+                    values[term] = result
+
+    threads = [threading.Thread(target=worker) for i in range(min(max_workers, work.qsize()))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        if isinstance(errors[0], AnsibleError):
+            raise errors[0]
+        raise AnsibleError("Unknown failure in query record: {0}".format(str(errors[0])))
+
+    return values
 
 
 class LookupModule(LookupBase):
@@ -148,6 +516,17 @@ class LookupModule(LookupBase):
         table = kwargs.pop('table', None)
         lookup_field = kwargs.pop('lookup_field', 'number')
         result_fields = kwargs.pop('result_fields', [])
+        max_url_length = int(kwargs.pop('max_url_length', 2048))
+        match = kwargs.pop('match', 'equals')
+        max_workers = int(kwargs.pop('max_workers', 4))
+        exclude_reference_link = kwargs.pop('exclude_reference_link', False)
+        display_value = to_text(kwargs.pop('display_value', 'false')).lower()
+        no_count = kwargs.pop('no_count', False)
+        cache = kwargs.pop('cache', False)
+        cache_ttl = int(kwargs.pop('cache_ttl', 300))
+        cache_negative_ttl = int(kwargs.pop('cache_negative_ttl', 60))
+        cache_dir = kwargs.pop('cache_dir', '~/.ansible/tmp/snow_lookup')
+        cache_max_size = int(kwargs.pop('cache_max_size', 10 * 1024 * 1024))
         ctx = kwargs.get('context', {})
 
         for term in terms:
@@ -161,12 +540,77 @@ class LookupModule(LookupBase):
             table = ctx.pop('table', None)
             lookup_field = ctx.pop('lookup_field', 'number')
             result_fields = ctx.pop('result_fields', [])
+            max_url_length = int(ctx.pop('max_url_length', max_url_length))
+            match = ctx.pop('match', match)
+            max_workers = int(ctx.pop('max_workers', max_workers))
+            exclude_reference_link = ctx.pop('exclude_reference_link', exclude_reference_link)
+            display_value = to_text(ctx.pop('display_value', display_value)).lower()
+            no_count = ctx.pop('no_count', no_count)
+            cache = ctx.pop('cache', cache)
+            cache_ttl = int(ctx.pop('cache_ttl', cache_ttl))
+            cache_negative_ttl = int(ctx.pop('cache_negative_ttl', cache_negative_ttl))
+            cache_dir = ctx.pop('cache_dir', cache_dir)
+            cache_max_size = int(ctx.pop('cache_max_size', cache_max_size))
 
-        for term in terms:
-            if not isinstance(term, dict):
-                value = snow_get(term, instance=instance, username=username,
-                                 password=password, table=table,
-                                 lookup_field=lookup_field, result_fields=result_fields)
-                ret.append(value)
+        if table is None:
+            raise AnsibleError("Service-Now: No table specified")
+        if lookup_field is None:
+            raise AnsibleError("Service-Now: No lookup_field specified")
+        result_fields = result_fields or []
+        if match not in MATCH_CHOICES:
+            raise AnsibleError("Service-Now: match must be one of %s" % ', '.join(MATCH_CHOICES))
+        if max_workers < 1:
+            raise AnsibleError("Service-Now: max_workers must be at least 1")
+        if display_value not in ('true', 'false', 'all'):
+            raise AnsibleError("Service-Now: display_value must be one of true, false, all")
+        params = snow_common.request_params(dict(exclude_reference_link=boolean(exclude_reference_link, strict=False),
+                                                 display_value=display_value,
+                                                 no_count=boolean(no_count, strict=False)))
+
+        keys = [to_text(term) for term in terms if not isinstance(term, dict)]
+        if not keys:
+            return ret
+
+        values = dict()
+        snow_cache = None
+        if boolean(cache, strict=False):
+            snow_cache = SnowLookupCache(cache_dir, cache_ttl, cache_negative_ttl, cache_max_size,
+                                         instance, username, table, lookup_field, result_fields,
+                                         match, sorted(params.items()), display_value)
+            for key in keys:
+                value = snow_cache.get(key)
+                if value is not None:
+                    values[key] = value
+            display.vvvv("Service-Now cache hits: %d of %d" % (len(values), len(keys)))
+
+        missing = [key for key in keys if key not in values]
+        if missing:
+            # one 429 backoff for every worker, each on a session of its own
+            backoff = SharedBackoff()
+
+            def clients():
+                conn = snow_client(instance=instance, username=username, password=password,
+                                   params=params, backoff=backoff)
+                chunk_conn = conn
+                if display_value == 'true':
+                    # IN queries need the raw lookup value to map records back to terms,
+                    # only they ask for both forms, on the same session
+                    chunk_conn = snow_client(instance=instance, username=username, password=password,
+                                             params=dict(params, sysparm_display_value='all'), session=conn.session)
+                return conn, chunk_conn
+
+            fetched = snow_get_many(snow_common.SessionPool(clients), missing, instance=instance, table=table,
+                                    lookup_field=lookup_field, result_fields=result_fields,
+                                    max_url_length=max_url_length, match=match, max_workers=max_workers)
+            if display_value == 'true':
+                fetched = dict((key, display_values(value)) for key, value in fetched.items())
+            values.update(fetched)
+            if snow_cache is not None:
+                for key, value in fetched.items():
+                    snow_cache.set(key, value)
+                snow_cache.evict()
+
+        for key in keys:
+            ret.append(values[key])
 
         return ret
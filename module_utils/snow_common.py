@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 Tim Rightnour <thegarbledone@gmail.com>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+Helpers shared by the ServiceNow modules and the snow lookup plugin.
+The options they work on are documented in doc_fragments/snow_sysparm.py.
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+from contextlib import contextmanager
+
+from ansible.module_utils.six.moves import queue
+from ansible.module_utils.six.moves.urllib.parse import quote_plus, urlencode
+from ansible.module_utils._text import to_bytes, to_native
+
+# room for the sysparm_limit and sysparm_offset that pysnow adds to every GET
+PAGING_PLACEHOLDER = dict(sysparm_limit='9999999999', sysparm_offset='9999999999')
+
+
+def sysparm_argument_spec():
+    """ argument_spec entries of the options request_params() reads """
+    return dict(
+        exclude_reference_link=dict(default=False, type='bool', required=False),
+        display_value=dict(default='false', type='str', required=False, choices=['true', 'false', 'all']),
+        no_count=dict(default=False, type='bool', required=False),
+    )
+
+
+def request_params(params):
+    """
+    sysparm_ parameters sent with every request to shrink the responses,
+    only the ones that differ from the ServiceNow defaults.
+    """
+    sysparms = dict()
+    if params['exclude_reference_link']:
+        sysparms['sysparm_exclude_reference_link'] = 'true'
+    if params['display_value'] != 'false':
+        sysparms['sysparm_display_value'] = params['display_value']
+    if params['no_count']:
+        sysparms['sysparm_no_count'] = 'true'
+    return sysparms
+
+
+def escape(value):
+    """ Escape a value for an encoded query, where ^ separates the conditions """
+    return value.replace('^', '^^')
+
+
+def field_value(value):
+    """ The raw value of a field, which is a dict with display_value=all or reference links """
+    if isinstance(value, dict):
+        value = value.get('value')
+    return to_native(value) if value is not None else ''
+
+
+def record_as(record, display_value):
+    """
+    Turn a record read with display_value=all into the one display_value
+    returns: the raw values for false, the display values for true, with
+    the link of reference fields kept next to them.
+    """
+    if display_value == 'all':
+        return record
+    form = 'display_value' if display_value == 'true' else 'value'
+    result = dict()
+    for name, field in record.items():
+        if isinstance(field, dict) and form in field:
+            if 'link' in field:
+                field = {form: field[form], 'link': field['link']}
+            else:
+                field = field[form]
+        result[name] = field
+    return result
+
+
+def in_queries(field, values, url, sysparms, max_url_length, suffix=''):
+    """
+    Build the encoded queries that find the records whose field is one of
+    values. A comma would split an IN list, so values holding one get an
+    equality query of their own. The others are packed into as few field IN
+    queries as fit, sent to url with sysparms, in URLs of at most
+    max_url_length characters. suffix, such as ^ORDERBYsys_id, ends every query.
+    Return a list of (values the query covers, query).
+    """
+    queries = [([value], '%s=%s%s' % (field, escape(value), suffix)) for value in values if ',' in value]
+    overhead = len('%s?%s' % (url, urlencode(dict(sysparms, sysparm_query='%sIN%s' % (field, suffix)))))
+    chunk = []
+    length = overhead
+    for value in values:
+        if ',' in value:
+            continue
+        value_length = len(quote_plus(to_bytes(escape(value)))) + len('%2C')
+        if chunk and length + value_length > max_url_length:
+            queries.append((chunk, '%sIN%s%s' % (field, ','.join(escape(v) for v in chunk), suffix)))
+            chunk = []
+            length = overhead
+        chunk.append(value)
+        length += value_length
+    if chunk:
+        queries.append((chunk, '%sIN%s%s' % (field, ','.join(escape(v) for v in chunk), suffix)))
+    return queries
+
+
+class SessionPool(object):
+    """
+    requests sessions, or clients holding one, for worker threads. A
+    session is not safe to share between threads, so every worker checks
+    one out for as long as it runs, and idle ones are handed to the next
+    workers to keep their connections alive. factory makes a new one.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.idle = queue.LifoQueue()
+
+    @contextmanager
+    def session(self):
+        try:
+            session = self.idle.get_nowait()
+        except queue.Empty:
+            session = self.factory()
+        try:
+            yield session
+        finally:
+            self.idle.put(session)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 Tim Rightnour <thegarbledone@gmail.com>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import hashlib
+import json
+import os
+import time
+
+
+class DatastoreSummaryCache(object):
+    """
+    Controller side cache of datastore summary lists, keyed by the calling
+    module, vCenter, datacenter and cluster
+    """
+    def __init__(self, module, namespace):
+        self.module = module
+        self.params = module.params
+        self.ttl = self.params['cache_ttl']
+        self.cache_dir = os.path.expanduser(self.params['cache_dir'])
+        # modules shaping the summaries differently must never read each other's entries
+        key = '%s|%s|%s|%s' % (namespace, self.params['hostname'], self.params['datacenter'], self.params['cluster'])
+        self.path = os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self):
+        """ Return (datastores, age) for a fresh entry, or (None, None) """
+        try:
+            with open(self.path) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None, None
+        age = time.time() - entry.get('timestamp', 0)
+        if age < 0 or age > self.ttl:
+            return None, None
+        return entry.get('datastores'), int(age)
+
+    def set(self, datastores):
+        """ Atomically write the datastore list, failures only cost a cache miss """
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            tmp = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(dict(timestamp=time.time(), datastores=datastores), f)
+            os.rename(tmp, self.path)
+        except (IOError, OSError):
+            pass
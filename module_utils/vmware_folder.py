@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 Tim Rightnour <thegarbledone@gmail.com>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+Folder lookup shared by the modules that act on every virtual machine of a folder.
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+try:
+    from pyVmomi import vim
+except ImportError:
+    pass
+
+from ansible.module_utils.vmware import find_datacenter_by_name
+
+
+def find_vm_folder(module, content, folder, datacenter):
+    """
+    Return the virtual machine folder named by folder, either a full
+    inventory path such as /folder1/datacenter1/vm/folder2, or a path
+    relative to the datacenter, with or without its leading vm, such as
+    /vm, vm/folder2 or folder2.
+    """
+    path = folder.strip('/')
+    obj = content.searchIndex.FindByInventoryPath(path)
+    if isinstance(obj, vim.Datacenter):
+        return obj.vmFolder
+    # a top level folder of the same name only holds datacenters
+    if isinstance(obj, vim.Folder) and 'VirtualMachine' in obj.childType:
+        return obj
+
+    dc = find_datacenter_by_name(content, datacenter)
+    if dc is None:
+        module.fail_json(msg="Unable to find datacenter '%s'" % datacenter)
+    parts = [part for part in path.split('/') if part]
+    if parts and parts[0] == 'vm':
+        parts = parts[1:]
+    obj = dc.vmFolder
+    for part in parts:
+        obj = content.searchIndex.FindChild(obj, part)
+        if not isinstance(obj, vim.Folder):
+            module.fail_json(msg="Unable to find folder '%s' in datacenter '%s'" % (folder, datacenter))
+    return obj
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 Tim Rightnour <thegarbledone@gmail.com>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+Helpers shared by the modules that move files to and from datastores
+through the /folder endpoint of vCenter or ESXi.
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import atexit
+import socket
+import ssl
+import threading
+import time
+
+try:
+    from pyVim import connect
+    from pyVmomi import vim
+    HAS_PYVMOMI = True
+except ImportError:
+    HAS_PYVMOMI = False
+
+from ansible.module_utils.six.moves import http_client
+from ansible.module_utils._text import to_native
+
+BUFSIZE = 1024 * 1024
+
+
+def ssl_context(validate_certs):
+    if validate_certs:
+        return ssl.create_default_context()
+    context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def connect_vsphere(module, username, password):
+    """ Log in to the vSphere API, return (service instance, content) """
+    if not HAS_PYVMOMI:
+        module.fail_json(msg='PyVmomi Python module required. Install using "pip install PyVmomi"')
+    try:
+        si = connect.SmartConnect(host=module.params['host'], user=username, pwd=password,
+                                  sslContext=ssl_context(module.params['validate_certs']))
+    except vim.fault.InvalidLogin as e:
+        module.fail_json(msg="Unable to log on to vCenter or ESXi API at %s: %s" % (module.params['host'], e.msg))
+    except Exception as e:
+        module.fail_json(msg="Unable to connect to vCenter or ESXi API at %s: %s" % (module.params['host'], to_native(e)))
+    atexit.register(connect.Disconnect, si)
+    return si, si.RetrieveContent()
+
+
+def find_datastore(module, content, datacenter, datastore):
+    dc = content.searchIndex.FindByInventoryPath(datacenter)
+    if not isinstance(dc, vim.Datacenter):
+        module.fail_json(msg='Failed to find datacenter "%s"' % datacenter)
+    for ds in dc.datastore:
+        if ds.name == datastore:
+            return ds
+    module.fail_json(msg='Failed to find datastore "%s" in datacenter "%s"' % (datastore, datacenter))
+
+
+def find_datastore_host(module, ds):
+    """ Return a connected ESXi host, outside maintenance mode, that has ds mounted and accessible """
+    for mount in ds.host:
+        if not (mount.mountInfo.mounted and mount.mountInfo.accessible):
+            continue
+        runtime = mount.key.runtime
+        if runtime.connectionState != 'connected' or runtime.inMaintenanceMode:
+            continue
+        return mount.key
+    module.fail_json(msg='No connected ESXi host has datastore "%s" mounted' % ds.name)
+
+
+def wait_for_task(task, timeout=None):
+    """
+    Poll task every half second, unlike the 15 second poll of the vmware
+    module_utils, return its result or raise with its error.
+    """
+    deadline = time.time() + timeout if timeout else None
+    while task.info.state in (vim.TaskInfo.State.queued, vim.TaskInfo.State.running):
+        if deadline is not None and time.time() > deadline:
+            raise Exception("Timed out after %s seconds waiting for task %s" % (timeout, task.info.key))
+        time.sleep(0.5)
+    if task.info.state == vim.TaskInfo.State.error:
+        raise Exception(task.info.error.msg)
+    return task.info.result
+
+
+class Throttle(object):
+    """
+    Token bucket shared by every stream of one run, limiting their combined
+    rate to rate bytes per second (unlimited when rate is None), and
+    recording transfer telemetry on the way. The clock starts at begin(),
+    right before the first transfer request, so logins, HEAD requests and
+    local hashing are not counted.
+    """
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.lock = threading.Lock()
+        # a burst of a tenth of a second, so no one second window can exceed the rate by much
+        self.burst = float(rate or 0) / 10
+        self.tokens = 0.0
+        self.start = self.end = self.first = None
+        self.last = self.window_start = None
+        self.bytes = 0
+        self.window_bytes = 0
+        self.peak = 0
+
+    def begin(self):
+        """ Start the clock, later calls change nothing """
+        with self.lock:
+            if self.start is None:
+                self.start = self.last = self.window_start = time.time()
+
+    def first_byte(self):
+        """ Record when the first byte of file data moved """
+        with self.lock:
+            if self.first is None:
+                self.first = time.time()
+
+    def consume(self, count):
+        """ Sleep while the streams are over the rate, then account count bytes """
+        self.begin()
+        wait = 0
+        if self.rate:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                # tokens may go negative, later callers then wait for the debt too
+                self.tokens -= count
+                if self.tokens < 0:
+                    wait = -self.tokens / self.rate
+        if wait:
+            time.sleep(wait)
+        with self.lock:
+            now = self.end = time.time()
+            self.bytes += count
+            self.window_bytes += count
+            if now - self.window_start >= 1:
+                self.peak = max(self.peak, self.window_bytes / (now - self.window_start))
+                self.window_start = now
+                self.window_bytes = 0
+
+    def stats(self):
+        """ Return bytes, elapsed seconds, average and peak bytes per second and time to first byte """
+        elapsed = 0
+        if self.start is not None:
+            elapsed = (self.end or time.time()) - self.start
+        throughput = self.bytes / elapsed if elapsed else 0
+        ttfb = None
+        if self.first is not None:
+            ttfb = round(self.first - self.start, 3)
+        # transfers shorter than one window have no better peak than their average
+        return dict(bytes=self.bytes, elapsed=round(elapsed, 3), throughput=int(throughput),
+                    peak_throughput=int(max(self.peak, throughput)), ttfb=ttfb)
+
+
+class DatastoreSession(object):
+    """
+    A keep-alive HTTPS connection to a datastore /folder endpoint.
+    Every worker thread owns one, so requests are never interleaved.
+    """
+    def __init__(self, host, validate_certs, timeout=None, chunk_size=BUFSIZE, throttle=None, headers=None):
+        self.host = host
+        self.context = ssl_context(validate_certs)
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.throttle = throttle
+        self.headers = headers or {}
+        self.conn = None
+        # bytes of request bodies handed to the socket, for progress accounting
+        self.sent = 0
+
+    def connect(self):
+        if self.conn is None:
+            self.conn = http_client.HTTPSConnection(self.host, timeout=self.timeout, context=self.context)
+        return self.conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def send(self, method, path, headers=None, data=None, offset=0):
+        """
+        Send a request and return the response, with its body left unread
+        for the caller to stream. data may be bytes or an mmap, data[offset:]
+        is sent in chunk_size slices so only one slice is ever copied into
+        memory. A kept-alive connection that the server has closed is
+        reopened once, other socket errors on requests with a body are left
+        to the caller to retry.
+        """
+        all_headers = dict(self.headers)
+        all_headers.update(headers or {})
+        # only requests moving file data count towards the transfer telemetry
+        timed = self.throttle is not None and (data is not None or method == 'GET')
+        if timed:
+            self.throttle.begin()
+        for attempt in (1, 2):
+            conn = self.connect()
+            try:
+                conn.putrequest(method, path, skip_accept_encoding=True)
+                for name, value in all_headers.items():
+                    conn.putheader(name, value)
+                if data is not None:
+                    conn.putheader('Content-Length', str(len(data) - offset))
+                conn.endheaders()
+                if data is not None:
+                    for start in range(offset, len(data), self.chunk_size):
+                        chunk = data[start:start + self.chunk_size]
+                        if self.throttle is not None:
+                            self.throttle.consume(len(chunk))
+                        conn.send(chunk)
+                        self.sent += len(chunk)
+                        if timed:
+                            self.throttle.first_byte()
+                resp = conn.getresponse()
+                if timed:
+                    self.throttle.first_byte()
+                return resp
+            except (http_client.BadStatusLine, http_client.CannotSendRequest):
+                self.close()
+                if attempt == 2:
+                    raise
+            except (http_client.HTTPException, socket.error):
+                self.close()
+                if attempt == 2 or data is not None:
+                    raise
+            except Exception:
+                self.close()
+                raise
+
+    def request(self, method, path, headers=None, data=None, offset=0):
+        """ send() a request and read all of the response, return (status, reason, headers, body) """
+        resp = self.send(method, path, headers, data, offset)
+        try:
+            body = resp.read()
+        except Exception:
+            self.close()
+            raise
+        if (resp.getheader('connection') or '').lower() == 'close':
+            self.close()
+        return resp.status, resp.reason, dict((k.lower(), v) for k, v in resp.getheaders()), body